@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'smartravelapp.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -131,3 +132,59 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Request profiling
+# Send a token from `manage.py profiling_token` in the X-Smartravel-Profile
+# header (or ?profile=) to profile a single request.
+
+SMARTRAVEL_PROFILING = False
+
+SMARTRAVEL_PROFILING_DIR = BASE_DIR / 'profiles'
+
+SMARTRAVEL_PROFILING_TOKEN_MAX_AGE = 3600
+
+
+# Multi-stop trips
+
+SMARTRAVEL_MAX_TRIP_STOPS = 25
+
+
+# Upstream rate limits
+# Token buckets are shared by all workers on the host through lock files in
+# SMARTRAVEL_RATE_LIMIT_DIR. Override the defaults in
+# smartravelapp/rate_limit.py per upstream, e.g.
+# {'openweathermap': {'rate': 1.0, 'capacity': 60, 'policy': 'reject'}}
+
+SMARTRAVEL_RATE_LIMITS = {}
+
+SMARTRAVEL_RATE_LIMIT_DIR = BASE_DIR / 'ratelimit'
+
+
+# Batch trip planning API
+
+SMARTRAVEL_BATCH_MAX_TRIPS = 500
+
+SMARTRAVEL_BATCH_MAX_WORKERS = 8
+
+
+# History retention
+# `manage.py archive_history` moves older rows to gzip NDJSON files in
+# SMARTRAVEL_ARCHIVE_DIR, partitioned by day.
+
+SMARTRAVEL_HISTORY_RETENTION_DAYS = 90
+
+SMARTRAVEL_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+
+# Reference data snapshot
+# Built with `manage.py build_reference_snapshot` and memory-mapped by every
+# worker at startup. Restart the workers to pick up a rebuilt snapshot.
+
+SMARTRAVEL_SNAPSHOT_PATH = BASE_DIR / 'reference.snapshot'
+
+
+# Forecast store
+# Refresh with `manage.py ingest_forecasts` (e.g. every 3 hours from cron).
+
+SMARTRAVEL_FORECAST_DIR = BASE_DIR / 'forecasts'
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class SmartravelappConfig(AppConfig):
     name = 'smartravelapp'
+
+    def ready(self):
+        # Map the shared reference snapshot so every worker starts warm
+        from .snapshot import load_snapshot
+        load_snapshot()
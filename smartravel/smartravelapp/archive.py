@@ -0,0 +1,118 @@
+import datetime
+import gzip
+import json
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import TravelHistory
+
+# Archives are stored as <archive dir>/date=YYYY-MM-DD/part-<id>.ndjson.gz
+PARTITION_PREFIX = 'date='
+
+
+def get_archive_dir():
+    return Path(getattr(settings, 'SMARTRAVEL_ARCHIVE_DIR', 'archive'))
+
+
+def _partition_dir(archive_dir, day):
+    return Path(archive_dir) / f"{PARTITION_PREFIX}{day.isoformat()}"
+
+
+def history_to_record(history):
+    """
+    Convert a TravelHistory row to a JSON-serialisable dict of all its fields.
+    """
+    record = {}
+    for field in TravelHistory._meta.concrete_fields:
+        value = getattr(history, field.attname)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        record[field.attname] = value
+    return record
+
+
+def write_partition(records, day, archive_dir=None):
+    """
+    Write one day's records to a new compressed part file.
+
+    The file is written under a temporary name and renamed into place once
+    complete, so readers never see a partial part.
+
+    Returns:
+        Path: The written part file
+    """
+    directory = _partition_dir(archive_dir or get_archive_dir(), day)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    path = directory / f"part-{uuid.uuid4().hex}.ndjson.gz"
+    temporary_path = directory / f".{path.name}.tmp"
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as part:
+        for record in records:
+            part.write(json.dumps(record, ensure_ascii=False))
+            part.write('\n')
+    with open(temporary_path, 'rb') as part:
+        os.fsync(part.fileno())
+    os.replace(temporary_path, path)
+    return path
+
+
+def archive_histories(histories, archive_dir=None):
+    """
+    Write TravelHistory rows to archive files partitioned by the day of their time.
+
+    Returns:
+        list: Paths of the written part files
+    """
+    days = {}
+    for history in histories:
+        day = timezone.localtime(history.time).date() if timezone.is_aware(history.time) else history.time.date()
+        days.setdefault(day, []).append(history_to_record(history))
+
+    return [
+        write_partition(records, day, archive_dir)
+        for day, records in sorted(days.items())
+    ]
+
+
+def iter_archived_history(start_date=None, end_date=None, archive_dir=None):
+    """
+    Read archived travel history between two dates (inclusive).
+
+    Only the partitions in the date range are opened.
+
+    Args:
+        start_date (date): First day to read, or None for no lower bound
+        end_date (date): Last day to read, or None for no upper bound
+        archive_dir (str): Archive directory (defaults to SMARTRAVEL_ARCHIVE_DIR)
+
+    Yields:
+        dict: Archived rows with 'time' parsed back to a datetime
+    """
+    archive_dir = Path(archive_dir or get_archive_dir())
+    if not archive_dir.is_dir():
+        return
+
+    partitions = []
+    for entry in archive_dir.iterdir():
+        if not entry.is_dir() or not entry.name.startswith(PARTITION_PREFIX):
+            continue
+        try:
+            day = datetime.date.fromisoformat(entry.name[len(PARTITION_PREFIX):])
+        except ValueError:
+            continue
+        if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+            partitions.append((day, entry))
+
+    for day, entry in sorted(partitions):
+        for path in sorted(entry.glob('part-*.ndjson.gz')):
+            with gzip.open(path, 'rt', encoding='utf-8') as part:
+                for line in part:
+                    record = json.loads(line)
+                    if record.get('time'):
+                        record['time'] = parse_datetime(record['time'])
+                    yield record
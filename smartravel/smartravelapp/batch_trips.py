@@ -0,0 +1,81 @@
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    from .get_weather import get_weather
+    from .get_directions import DirectionsAPI
+    from .records import RouteSummary
+except ImportError:  # Running as a standalone script
+    from get_weather import get_weather
+    from get_directions import DirectionsAPI
+    from records import RouteSummary
+
+
+def _run_all(executor, function, items):
+    """
+    Run function over items on the executor and return {item: result}.
+    """
+    futures = {
+        item: executor.submit(contextvars.copy_context().run, function, item)
+        for item in items
+    }
+    return {item: future.result() for item, future in futures.items()}
+
+
+def fetch_trip_data(trips, max_workers=8, api_key=None):
+    """
+    Fetch weather and directions for many trips with as few upstream calls as possible.
+
+    Each distinct city is looked up (weather and geocode) once and each
+    distinct (start, destination) pair is routed once, no matter how many
+    trips share them. Calls run in parallel on at most max_workers threads.
+
+    Args:
+        trips (list): (start, destination) tuples
+        max_workers (int): Maximum number of concurrent upstream calls
+        api_key (str): OpenRouteService API key (optional)
+
+    Returns:
+        tuple: ({city: WeatherSnapshot}, {(start, destination): RouteSummary})
+    """
+    cities = sorted({city for trip in trips for city in trip})
+    pairs = sorted(set(trips))
+    directions_api = DirectionsAPI(api_key)
+
+    logging.info(f"Planning {len(trips)} trips: {len(cities)} distinct cities, {len(pairs)} distinct routes")
+
+    def geocode(city):
+        """
+        (coordinates, None) for a city, or (None, error) if geocoding failed.
+        """
+        try:
+            coords = directions_api.geocode_address(city)
+        except requests.RequestException as e:
+            # Rate limits and outages are reported as such, not as a bad address
+            logging.error(f"Error geocoding {city}: {e}")
+            return None, f"Geocoding failed: {e}"
+        if not coords:
+            return None, f"Unable to geocode address: '{city}'. Please check the spelling or try a more specific location name."
+        return coords, None
+
+    def route(pair):
+        start, destination = pair
+        # Cities that failed to geocode are not retried for every route
+        (start_coords, start_error), (destination_coords, destination_error) = geocodes[start], geocodes[destination]
+        if start_error or destination_error:
+            return RouteSummary.failure(start_error or destination_error)
+        return directions_api.get_route([start_coords, destination_coords], start, destination)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        weather_futures = {
+            city: executor.submit(contextvars.copy_context().run, get_weather, city)
+            for city in cities
+        }
+        geocodes = _run_all(executor, geocode, cities)
+        directions = _run_all(executor, route, pairs)
+        weather = {city: future.result() for city, future in weather_futures.items()}
+
+    return weather, directions
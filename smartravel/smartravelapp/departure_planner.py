@@ -0,0 +1,121 @@
+import datetime
+import time
+
+from .forecast_store import get_forecast_store, SLOT_SECONDS
+
+# OpenWeatherMap condition id groups: 2xx thunderstorm, 3xx drizzle, 5xx rain, 6xx snow
+BAD_WEATHER_GROUPS = {2: 'thunderstorm', 3: 'drizzle', 5: 'rain', 6: 'snow'}
+
+# Same limits as get_travel_recommendation()
+EARLIEST_DEPARTURE_HOUR = 6
+LATEST_DEPARTURE_HOUR = 22
+MIN_TEMP = -10
+MAX_TEMP = 35
+
+
+def _local_time(timestamp, timezone_offset):
+    return datetime.datetime.fromtimestamp(
+        timestamp, datetime.timezone(datetime.timedelta(seconds=timezone_offset))
+    )
+
+
+def _slot_issues(series, slot, place):
+    """
+    Describe what makes a forecast slot bad for travel, if anything.
+    """
+    issues = []
+    condition = BAD_WEATHER_GROUPS.get(series.conditions[slot] // 100)
+    if condition:
+        issues.append(f"{condition} at {place}")
+
+    temp = series.temps[slot]
+    if temp < MIN_TEMP:
+        issues.append(f"extreme cold at {place}")
+    elif temp > MAX_TEMP:
+        issues.append(f"extreme heat at {place}")
+    return issues
+
+
+def plan_departures(start, destination, duration, limit=3, now=None, store=None):
+    """
+    Find the best departure windows for a trip from the locally stored forecasts.
+
+    Every 3 hour forecast slot at the start is a candidate departure. It is
+    judged on the weather at the start when leaving, the weather at the
+    destination on arrival (departure + duration) and the local departure
+    hour, like get_travel_recommendation(). Consecutive slots with the same
+    verdict are merged into windows. No upstream calls are made.
+
+    Args:
+        start (str): Starting location
+        destination (str): Destination location
+        duration (float): Trip duration in seconds
+        limit (int): Maximum number of windows to return
+        now (float): Current unix time (defaults to time.time())
+        store (ForecastStore): Forecast store (defaults to SMARTRAVEL_FORECAST_DIR)
+
+    Returns:
+        list: Windows, best and soonest first, as dicts with 'depart_from',
+              'depart_until', 'arrive_from', 'arrive_until' (aware datetimes in
+              local time) and 'issues' (empty for a good window). None if there
+              is no forecast for either city.
+    """
+    store = store or get_forecast_store()
+    start_series = store.read(start)
+    destination_series = store.read(destination)
+    if not start_series or not destination_series:
+        return None
+
+    now = now or time.time()
+    duration = int(duration or 0)
+
+    candidates = []
+    for slot, slot_time in enumerate(start_series.timestamps):
+        departure = max(slot_time, int(now))
+        if departure >= slot_time + SLOT_SECONDS:
+            # Slot is already over
+            continue
+
+        arrival_slot = destination_series.slot_at(departure + duration)
+        if arrival_slot is None:
+            # Arrival is beyond the destination forecast
+            continue
+
+        issues = _slot_issues(start_series, slot, start) + _slot_issues(destination_series, arrival_slot, destination)
+        local_departure = _local_time(departure, start_series.timezone_offset)
+        if not EARLIEST_DEPARTURE_HOUR <= local_departure.hour <= LATEST_DEPARTURE_HOUR:
+            issues.append("very late/early departure")
+
+        candidates.append((departure, slot_time + SLOT_SECONDS, issues))
+
+    # Merge consecutive slots with the same verdict into windows
+    windows = []
+    for departure, slot_end, issues in candidates:
+        if windows and windows[-1]['issues'] == issues and windows[-1]['_end'] == departure:
+            windows[-1]['_end'] = slot_end
+        else:
+            windows.append({'_start': departure, '_end': slot_end, 'issues': issues})
+
+    windows.sort(key=lambda window: (len(window['issues']), window['_start']))
+
+    results = []
+    for window in windows[:limit]:
+        results.append({
+            'depart_from': _local_time(window['_start'], start_series.timezone_offset),
+            'depart_until': _local_time(window['_end'], start_series.timezone_offset),
+            'arrive_from': _local_time(window['_start'] + duration, destination_series.timezone_offset),
+            'arrive_until': _local_time(window['_end'] + duration, destination_series.timezone_offset),
+            'issues': window['issues']
+        })
+    return results
+
+
+def describe_window(window):
+    """
+    Short human readable description of a departure window.
+    """
+    depart_from = window['depart_from']
+    depart_until = window['depart_until']
+    if depart_from.date() == depart_until.date():
+        return f"{depart_from:%a %H:%M} - {depart_until:%H:%M}"
+    return f"{depart_from:%a %H:%M} - {depart_until:%a %H:%M}"
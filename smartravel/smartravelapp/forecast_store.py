@@ -0,0 +1,170 @@
+import array
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+# One file per city (little-endian):
+#   header       magic, version, UTC offset of the city in seconds, fetch time, slot count
+#   timestamps   count x uint32 unix time of each 3 hour slot
+#   temps        count x float32 degrees Celsius
+#   conditions   count x uint16 OpenWeatherMap condition id
+FORECAST_MAGIC = b'STRVFCST'
+FORECAST_VERSION = 1
+_HEADER = struct.Struct('<8sHiII')
+
+# Forecast slots are 3 hours apart
+SLOT_SECONDS = 3 * 3600
+
+
+class ForecastSeries:
+    """
+    A city's forecast as compact parallel arrays, one entry per 3 hour slot.
+    """
+
+    __slots__ = ('timezone_offset', 'fetched_at', 'timestamps', 'temps', 'conditions')
+
+    def __init__(self, timezone_offset, fetched_at, timestamps, temps, conditions):
+        self.timezone_offset = timezone_offset
+        self.fetched_at = fetched_at
+        self.timestamps = timestamps
+        self.temps = temps
+        self.conditions = conditions
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_api(cls, forecast_data, fetched_at=None):
+        """
+        Build a series from an OpenWeatherMap forecast response.
+        """
+        timestamps = array.array('I')
+        temps = array.array('f')
+        conditions = array.array('H')
+        for slot in sorted(forecast_data.get('list', []), key=lambda slot: slot.get('dt', 0)):
+            weather = slot.get('weather') or [{}]
+            timestamps.append(int(slot['dt']))
+            temps.append(float(slot.get('main', {}).get('temp', 0)))
+            conditions.append(int(weather[0].get('id', 800)))
+
+        return cls(
+            int(forecast_data.get('city', {}).get('timezone', 0)),
+            int(fetched_at or time.time()),
+            timestamps, temps, conditions
+        )
+
+    def slot_at(self, timestamp):
+        """
+        Index of the forecast slot covering a unix time, or None if outside the forecast.
+        """
+        if not self.timestamps or timestamp < self.timestamps[0] or timestamp >= self.timestamps[-1] + SLOT_SECONDS:
+            return None
+
+        # Binary search for the last slot starting at or before timestamp
+        low, high = 0, len(self.timestamps) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.timestamps[middle] <= timestamp:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+
+def _city_filename(city_name):
+    return re.sub(r'[^a-z0-9]+', '_', city_name.lower()).strip('_') + '.fcst'
+
+
+def _to_little_endian(values):
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class ForecastStore:
+    """
+    Directory of per-city forecast files.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def path_for(self, city_name):
+        return os.path.join(self.directory, _city_filename(city_name))
+
+    def write(self, city_name, series):
+        """
+        Save a city's forecast, replacing the previous one atomically.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(city_name)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'wb') as forecast_file:
+            forecast_file.write(_HEADER.pack(
+                FORECAST_MAGIC, FORECAST_VERSION, series.timezone_offset, series.fetched_at, len(series)
+            ))
+            _to_little_endian(series.timestamps).tofile(forecast_file)
+            _to_little_endian(series.temps).tofile(forecast_file)
+            _to_little_endian(series.conditions).tofile(forecast_file)
+        os.replace(temporary_path, path)
+
+    def read(self, city_name):
+        """
+        Load a city's forecast, or None if it has not been ingested or
+        the file is not a complete forecast.
+
+        Parsed series are kept in memory until the file changes.
+        """
+        path = self.path_for(city_name)
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+
+        with open(path, 'rb') as forecast_file:
+            try:
+                magic, version, timezone_offset, fetched_at, count = _HEADER.unpack(forecast_file.read(_HEADER.size))
+                if magic != FORECAST_MAGIC or version != FORECAST_VERSION:
+                    return None
+
+                columns = []
+                for typecode in ('I', 'f', 'H'):
+                    column = array.array(typecode)
+                    column.fromfile(forecast_file, count)
+                    columns.append(_to_little_endian(column))
+            except (struct.error, EOFError, ValueError):
+                # Shorter than the header, or cut off inside a column
+                return None
+
+        series = ForecastSeries(timezone_offset, fetched_at, *columns)
+        with self._cache_lock:
+            self._cache[path] = (modified, series)
+        return series
+
+
+_stores = {}
+
+
+def get_forecast_store(directory=None):
+    """
+    Get the forecast store for SMARTRAVEL_FORECAST_DIR (or the given directory).
+    """
+    if directory is None:
+        from django.conf import settings
+        directory = getattr(settings, 'SMARTRAVEL_FORECAST_DIR', 'forecasts')
+    directory = str(directory)
+
+    store = _stores.get(directory)
+    if store is None:
+        store = _stores.setdefault(directory, ForecastStore(directory))
+    return store
@@ -27,4 +27,68 @@ class TravelHistoryForm(ModelForm):
     
     class Meta:
         model = TravelHistory
-        fields = ['start', 'destination']
\ No newline at end of file
+        fields = ['start', 'destination']
+
+class MultiStopTripForm(forms.Form):
+    """
+    Form for planning a trip through several cities.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        # Extract location_choices and max_stops from kwargs if provided
+        location_choices = kwargs.pop('location_choices', None)
+        self.max_stops = kwargs.pop('max_stops', 25)
+        super().__init__(*args, **kwargs)
+        
+        # Get location choices from API if not provided
+        if location_choices is None:
+            location_choices = get_locations_from_api()
+        
+        self.fields['start'] = forms.ChoiceField(
+            choices=location_choices,
+            widget=forms.Select(attrs={'class': 'form-control'})
+        )
+        self.fields['stops'] = forms.MultipleChoiceField(
+            choices=[choice for choice in location_choices if choice[0]],
+            widget=forms.SelectMultiple(attrs={'class': 'form-control', 'size': 10}),
+            help_text="The visiting order is chosen for you."
+        )
+        self.fields['destination'] = forms.ChoiceField(
+            choices=location_choices,
+            required=False,
+            widget=forms.Select(attrs={'class': 'form-control'}),
+            help_text="Optional. Leave empty to end at the last stop."
+        )
+    
+    def clean_stops(self):
+        stops = self.cleaned_data['stops']
+        if len(stops) > self.max_stops:
+            raise forms.ValidationError(f"Please choose at most {self.max_stops} stops.")
+        return stops
+
+
+class HistoryFilterForm(forms.Form):
+    """
+    Filters for the travel history list and search API.
+    
+    Start and destination are free text, so entries for cities that are
+    no longer offered can still be found.
+    """
+    
+    STATUS_CHOICES = [
+        ('', 'Any'),
+        ('success', 'Directions found'),
+        ('failed', 'Directions failed'),
+    ]
+    
+    start = forms.CharField(max_length=100, required=False)
+    destination = forms.CharField(max_length=100, required=False)
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    status = forms.ChoiceField(choices=STATUS_CHOICES, required=False)
@@ -2,19 +2,116 @@ import requests
 import json
 import logging
 
+try:
+    # Optional: lets lean parsing stream the response instead of loading it whole
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    from .timing import phase
+    from .rate_limit import acquire, report_throttled, RateLimitExceeded
+    from .records import RouteSummary
+except ImportError:  # Running as a standalone script
+    from timing import phase
+    from rate_limit import acquire, report_throttled, RateLimitExceeded
+    from records import RouteSummary
+
+# The only keys lean parsing keeps from a directions response
+LEAN_ROUTE_KEYS = frozenset(['routes', 'segments', 'steps', 'duration', 'distance', 'instruction'])
+
+
+def _lean_object(pairs):
+    """
+    json object_pairs_hook that drops everything a route summary doesn't use
+    (geometry, way points, metadata, ...) while the response is being decoded.
+    """
+    return {key: value for key, value in pairs if key in LEAN_ROUTE_KEYS}
+
+
+def _parse_route_stream(stream):
+    """
+    Incrementally parse a directions response with ijson, keeping only the
+    duration, distance and step instructions of the first route.
+    
+    The whole body is still read, so a truncated response fails to parse
+    like it does with json.loads().
+    
+    Returns:
+        dict: {'routes': [{'segments': [...]}]} shaped like the lean response
+    """
+    segments = []
+    routes = 0
+    for prefix, event, value in ijson.parse(stream):
+        if prefix == 'routes.item' and event == 'start_map':
+            routes += 1
+        elif routes != 1:
+            # Alternative routes are never used
+            continue
+        elif prefix == 'routes.item.segments.item':
+            if event == 'start_map':
+                segments.append({'duration': 0, 'distance': 0, 'steps': []})
+        elif prefix == 'routes.item.segments.item.duration':
+            segments[-1]['duration'] = float(value)
+        elif prefix == 'routes.item.segments.item.distance':
+            segments[-1]['distance'] = float(value)
+        elif prefix == 'routes.item.segments.item.steps.item':
+            if event == 'start_map':
+                segments[-1]['steps'].append({'instruction': 'N/A', 'distance': 0})
+        elif prefix == 'routes.item.segments.item.steps.item.instruction':
+            segments[-1]['steps'][-1]['instruction'] = value
+        elif prefix == 'routes.item.segments.item.steps.item.distance':
+            segments[-1]['steps'][-1]['distance'] = float(value)
+    
+    return {'routes': [{'segments': segments}] if segments else []}
+
+
+class _ResponseReader:
+    """
+    Read-only file object over a streamed response's iter_content().
+
+    Feeding ijson through requests (rather than response.raw) keeps dropped
+    connections and timeouts wrapped as requests exceptions.
+    """
+
+    def __init__(self, response, chunk_size=16 * 1024):
+        self._chunks = response.iter_content(chunk_size)
+
+    def read(self, size=-1):
+        if size == 0:
+            # ijson probes with read(0) to tell bytes from text
+            return b''
+        return next(self._chunks, b'')
+
+
+# Errors raised for a response body that is not valid (or complete) JSON
+_DECODE_ERRORS = (ValueError,) + ((ijson.JSONError,) if ijson is not None else ())
+
+
 class DirectionsAPI:
     """
     Fetches driving directions between two locations using OpenRouteService API.
     """
     
-    def __init__(self, api_key=None):
+    # Successful geocodes shared by all instances in this process,
+    # keyed by the address as given
+    _geocode_cache = {}
+    
+    def __init__(self, api_key=None, keep_raw=False):
         """
         Initialize the DirectionsAPI with API key and endpoints.
+        
+        Args:
+            api_key (str): OpenRouteService API key (optional)
+            keep_raw (bool): Keep the full API response in 'raw_data'. By default
+                             only duration, distance and steps are parsed.
         """
         # Use provided API key or default to your actual key
         self.api_key = api_key or "eyJvcmciOiI1YjNjZTM1OTc4NTExMTAwMDFjZjYyNDgiLCJpZCI6IjBhY2Q2MWUyMzE4MTRmYzA5M2EwMGI3ZDkwNmJiNzE1IiwiaCI6Im11cm11cjY0In0="
         self.directions_api = "https://api.openrouteservice.org/v2/directions/driving-car"
         self.geocode_api = "https://api.openrouteservice.org/geocode/search"
+        self.matrix_api = "https://api.openrouteservice.org/v2/matrix/driving-car"
+        self.keep_raw = keep_raw
         
     def geocode_address(self, address):
         """
@@ -25,7 +122,14 @@ class DirectionsAPI:
             
         Returns:
             list: [longitude, latitude] coordinates or None if failed
+            
+        Raises:
+            RateLimitExceeded: If the geocoding quota is used up
         """
+        cached = DirectionsAPI._geocode_cache.get(address)
+        if cached is not None:
+            return cached
+        
         # Try multiple search strategies to improve geocoding accuracy
         search_queries = [
             f"{address}, British Columbia, Canada",  # Most specific
@@ -38,9 +142,15 @@ class DirectionsAPI:
             print(f"Trying to geocode: '{search_query}'")
             
             url = f"{self.geocode_api}?api_key={self.api_key}&text={search_query}&boundary.country=CA&size=1"
-            response = requests.get(url, timeout=10)
+            acquire('ors_geocode')
+            with phase('geocode'):
+                response = requests.get(url, timeout=10)
             
-            if response.status_code == 200:
+            if response.status_code == 429:
+                # The other search strategies would be rejected too
+                report_throttled('ors_geocode', response.headers.get('Retry-After'))
+                raise RateLimitExceeded(f"Geocoding rate limit reached while looking up '{address}'")
+            elif response.status_code == 200:
                 json_data = response.json()
                 if json_data.get("features"):
                     coords = json_data["features"][0]["geometry"]["coordinates"]
@@ -48,6 +158,7 @@ class DirectionsAPI:
                     # Validate coordinates (longitude, latitude)
                     if -180 <= coords[0] <= 180 and -90 <= coords[1] <= 90:
                         print(f"Successfully geocoded '{address}' to coordinates: {coords}")
+                        DirectionsAPI._geocode_cache[address] = coords
                         return coords
                     else:
                         print(f"Invalid coordinates received for '{address}': {coords}")
@@ -72,31 +183,44 @@ class DirectionsAPI:
             destination (str): Destination location/address
             
         Returns:
-            dict: Direction data with route info, duration, distance, and steps
+            RouteSummary: Route info, duration, distance, and steps, or the error
         """
         print(f"Getting directions from '{origin}' to '{destination}'")
         
         # Geocode the addresses using API only
-        orig_coords = self.geocode_address(origin)
-        dest_coords = self.geocode_address(destination)
+        try:
+            orig_coords = self.geocode_address(origin)
+            dest_coords = self.geocode_address(destination)
+        except requests.RequestException as e:
+            logging.error(f"Error geocoding addresses: {e}")
+            return RouteSummary.failure(f"Geocoding failed: {e}")
 
         if not orig_coords:
-            return {
-                'success': False,
-                'error': f"Unable to geocode origin address: '{origin}'. Please check the spelling or try a more specific location name."
-            }
+            return RouteSummary.failure(f"Unable to geocode origin address: '{origin}'. Please check the spelling or try a more specific location name.")
         
         if not dest_coords:
-            return {
-                'success': False,
-                'error': f"Unable to geocode destination address: '{destination}'. Please check the spelling or try a more specific location name."
-            }
+            return RouteSummary.failure(f"Unable to geocode destination address: '{destination}'. Please check the spelling or try a more specific location name.")
 
         print(f"Attempting to route from {orig_coords} to {dest_coords}")
 
+        return self.get_route([orig_coords, dest_coords], origin, destination)
+
+    def get_route(self, coordinates, origin, destination):
+        """
+        Get a driving route through one or more legs of coordinates.
+
+        Args:
+            coordinates (list): [longitude, latitude] pairs in visiting order
+            origin (str): Label of the first location
+            destination (str): Label of the last location
+
+        Returns:
+            RouteSummary: Route info, duration, distance, and steps, or the error.
+                          Multi-leg routes also include per-leg durations/distances.
+        """
         # Construct the JSON body for the POST request
         body = {
-            "coordinates": [orig_coords, dest_coords]
+            "coordinates": coordinates
         }
 
         # Make the POST request
@@ -105,99 +229,174 @@ class DirectionsAPI:
             "Content-Type": "application/json"
         }
         
-        response = requests.post(self.directions_api, headers=headers, json=body, timeout=15)
+        try:
+            acquire('ors_directions')
+            with phase('route'):
+                response = requests.post(self.directions_api, headers=headers, json=body, timeout=15, stream=True)
+                json_data = self._read_route_response(response) if response.status_code == 200 else None
+        except requests.RequestException as e:
+            logging.error(f"Error fetching directions: {e}")
+            return RouteSummary.failure(f"Routing failed: {e}")
         
-        if response.status_code == 200:
-            json_data = response.json()
+        if response.status_code == 429:
+            report_throttled('ors_directions', response.headers.get('Retry-After'))
+            return RouteSummary.failure("Routing failed: the directions service rate limit was reached. Please try again shortly.")
+        elif response.status_code == 200:
             if 'routes' in json_data and json_data['routes']:
                 route = json_data['routes'][0]
                 if 'segments' in route and route['segments']:
-                    segment = route['segments'][0]
-                    
                     # Extract trip duration and distance
-                    duration = segment.get('duration', 0)
-                    distance = segment.get('distance', 0)
+                    duration = 0
+                    distance = 0
+                    legs = []
                     
                     # Extract step-by-step directions
                     steps = []
-                    if 'steps' in segment:
-                        for step in segment['steps']:
-                            instruction = step.get('instruction', 'N/A')
-                            step_distance = step.get('distance', 0)
-                            steps.append({
-                                'instruction': instruction,
-                                'distance': step_distance
-                            })
+                    for segment in route['segments']:
+                        leg_duration = segment.get('duration', 0)
+                        leg_distance = segment.get('distance', 0)
+                        duration += leg_duration
+                        distance += leg_distance
+                        legs.append((leg_duration, leg_distance))
+                        
+                        if 'steps' in segment:
+                            for step in segment['steps']:
+                                instruction = step.get('instruction', 'N/A')
+                                step_distance = step.get('distance', 0)
+                                steps.append((instruction, step_distance))
                     
-                    return {
-                        'success': True,
-                        'origin': origin,
-                        'destination': destination,
-                        'duration': duration,  # in seconds
-                        'distance': distance,  # in meters
-                        'steps': steps,
-                        'raw_data': json_data
-                    }
+                    return RouteSummary(
+                        True,
+                        origin=origin,
+                        destination=destination,
+                        duration=duration,  # in seconds
+                        distance=distance,  # in meters
+                        steps=steps,
+                        legs=legs if len(legs) > 1 else None,
+                        raw_data=json_data if self.keep_raw else None
+                    )
                 else:
-                    return {
-                        'success': False,
-                        'error': "No segments found in the route."
-                    }
+                    return RouteSummary.failure("No segments found in the route.")
             else:
-                return {
-                    'success': False,
-                    'error': "No routes found in the response."
-                }
+                return RouteSummary.failure("No routes found in the response.")
         else:
             # Handle specific API errors
-            error_data = response.json()
-            if 'error' in error_data:
+            try:
+                error_data = response.json()
+            except ValueError:
+                error_data = {}
+            if isinstance(error_data.get('error'), dict):
                 error_message = error_data['error'].get('message', 'Unknown API error')
                 if 'routable point' in error_message:
-                    return {
-                        'success': False,
-                        'error': f"Routing failed: Cannot find drivable roads near the geocoded location for {origin} or {destination}. The API coordinates may point to an area without vehicle access (like a park, water body, or pedestrian area). You might try using a more specific address or nearby landmark."
-                    }
+                    return RouteSummary.failure(f"Routing failed: Cannot find drivable roads near the geocoded location for {origin} or {destination}. The API coordinates may point to an area without vehicle access (like a park, water body, or pedestrian area). You might try using a more specific address or nearby landmark.")
                 elif 'coordinate' in error_message:
-                    return {
-                        'success': False,
-                        'error': f"Coordinate error: The geocoded coordinates for {origin} or {destination} are not suitable for vehicle routing. This location might be in a restricted area or the geocoding result needs refinement."
-                    }
+                    return RouteSummary.failure(f"Coordinate error: The geocoded coordinates for {origin} or {destination} are not suitable for vehicle routing. This location might be in a restricted area or the geocoding result needs refinement.")
                 else:
-                    return {
-                        'success': False,
-                        'error': f"Routing error: {error_message}"
-                    }
+                    return RouteSummary.failure(f"Routing error: {error_message}")
             else:
-                return {
-                    'success': False,
-                    'error': f"API Error: {response.status_code} - {response.text[:200]}"
-                }
+                return RouteSummary.failure(f"API Error: {response.status_code} - {response.text[:200]}")
+
+    def _read_route_response(self, response):
+        """
+        Decode a successful directions response.
+        
+        Unless keep_raw is set, only the fields get_route() uses are kept:
+        streamed with ijson when it is installed, otherwise pruned while
+        the JSON is decoded.
+        
+        Raises:
+            requests.RequestException: If the connection fails while the body
+                                       is read, or the body is not valid JSON
+        """
+        try:
+            if self.keep_raw:
+                return response.json()
+            if ijson is not None:
+                return _parse_route_stream(_ResponseReader(response))
+            return json.loads(response.content, object_pairs_hook=_lean_object)
+        except _DECODE_ERRORS as e:
+            raise requests.RequestException(f"Invalid directions response: {e}") from e
+        finally:
+            response.close()
+
+    def get_duration_matrix(self, coordinates):
+        """
+        Get the driving duration and distance between every pair of locations
+        with a single matrix request.
+        
+        Args:
+            coordinates (list): [longitude, latitude] pairs
+            
+        Returns:
+            dict: 'durations' (seconds) and 'distances' (meters) as square
+                  matrices indexed like coordinates, or error information.
+                  Unroutable pairs are None.
+        """
+        body = {
+            "locations": coordinates,
+            "metrics": ["duration", "distance"]
+        }
+        headers = {
+            "Authorization": self.api_key,
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            acquire('ors_matrix')
+            with phase('route'):
+                response = requests.post(self.matrix_api, headers=headers, json=body, timeout=15)
+        except requests.RequestException as e:
+            logging.error(f"Error fetching duration matrix: {e}")
+            return {
+                'success': False,
+                'error': f"Matrix request failed: {e}"
+            }
+        
+        if response.status_code == 429:
+            report_throttled('ors_matrix', response.headers.get('Retry-After'))
+        if response.status_code != 200:
+            return {
+                'success': False,
+                'error': f"Matrix API Error: {response.status_code} - {response.text[:200]}"
+            }
+        
+        json_data = response.json()
+        if 'durations' not in json_data:
+            return {
+                'success': False,
+                'error': "No durations found in the matrix response."
+            }
+        
+        return {
+            'success': True,
+            'durations': json_data['durations'],
+            'distances': json_data.get('distances')
+        }
     
     def format_directions_summary(self, directions_data):
         """
         Format directions data into a readable summary string.
         
         Args:
-            directions_data (dict): The result from get_directions()
+            directions_data (RouteSummary): The result from get_directions()
             
         Returns:
             str: Formatted summary of the route
         """
-        if not directions_data.get('success'):
-            return f"Error: {directions_data.get('error', 'Unknown error')}"
+        if not directions_data.success:
+            return f"Error: {directions_data.error or 'Unknown error'}"
         
-        duration_minutes = directions_data['duration'] // 60
-        distance_km = directions_data['distance'] / 1000
+        duration_minutes = directions_data.duration // 60
+        distance_km = directions_data.distance / 1000
         
-        summary = f"Route from {directions_data['origin']} to {directions_data['destination']}\n"
+        summary = f"Route from {directions_data.origin} to {directions_data.destination}\n"
         summary += f"Duration: {duration_minutes} minutes\n"
         summary += f"Distance: {distance_km:.2f} km\n"
         summary += "Directions:\n"
         
-        for i, step in enumerate(directions_data['steps'], 1):
-            step_distance_km = step['distance'] / 1000
-            summary += f"{i}. {step['instruction']} ({step_distance_km:.2f} km)\n"
+        for i, (instruction, step_distance) in enumerate(directions_data.steps, 1):
+            step_distance_km = step_distance / 1000
+            summary += f"{i}. {instruction} ({step_distance_km:.2f} km)\n"
         
         return summary
     
@@ -214,30 +413,30 @@ class DirectionsAPI:
         
         directions = self.get_directions(origin, destination)
         
-        if directions['success']:
+        if directions.success:
             print("API Status: Successful route call.\n")
             print("=" * 50)
             print(f"Directions from {origin} to {destination}")
             
-            duration_minutes = directions['duration'] // 60
-            distance_km = directions['distance'] / 1000
+            duration_minutes = directions.duration // 60
+            distance_km = directions.distance / 1000
             
-            print(f"Trip Duration: {duration_minutes} minutes ({directions['duration']} seconds)")
-            print(f"Distance: {distance_km:.2f} km ({directions['distance']} meters)")
+            print(f"Trip Duration: {duration_minutes} minutes ({directions.duration} seconds)")
+            print(f"Distance: {distance_km:.2f} km ({directions.distance} meters)")
             print("=" * 50)
             
-            for i, step in enumerate(directions['steps'], 1):
-                step_distance_km = step['distance'] / 1000
-                print(f"{i}. {step['instruction']} ({step_distance_km:.2f} km)")
+            for i, (instruction, step_distance) in enumerate(directions.steps, 1):
+                step_distance_km = step_distance / 1000
+                print(f"{i}. {instruction} ({step_distance_km:.2f} km)")
             
             print("=" * 50)
         else:
-            print(f"Error: {directions['error']}")
+            print(f"Error: {directions.error}")
         print()
 
 
 # Function for easy import in Django views
-def get_directions_between_locations(origin, destination, api_key=None):
+def get_directions_between_locations(origin, destination, api_key=None, keep_raw=False):
     """
     Convenience function to get directions between two locations.
     
@@ -245,11 +444,12 @@ def get_directions_between_locations(origin, destination, api_key=None):
         origin (str): Starting location
         destination (str): Destination location
         api_key (str): OpenRouteService API key (optional, uses default if not provided)
+        keep_raw (bool): Include the full API response as 'raw_data' (optional)
         
     Returns:
-        dict: Direction data or error information
+        RouteSummary: Direction data or error information
     """
-    directions_api = DirectionsAPI(api_key)
+    directions_api = DirectionsAPI(api_key, keep_raw=keep_raw)
     return directions_api.get_directions(origin, destination)
 
 
@@ -264,12 +464,12 @@ if __name__ == "__main__":
     
     # Method 1: Get structured data
     directions = api.get_directions(origin, destination)
-    if directions['success']:
+    if directions.success:
         print("Route found successfully!")
         summary = api.format_directions_summary(directions)
         print(summary)
     else:
-        print(f"Error: {directions['error']}")
+        print(f"Error: {directions.error}")
     
     # Method 2: Print formatted directions
     api.print_directions(origin, destination)
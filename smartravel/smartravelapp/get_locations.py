@@ -1,6 +1,15 @@
 import requests
 import logging
 
+try:
+    from .timing import phase
+    from .rate_limit import acquire, report_throttled
+    from .snapshot import get_snapshot
+except ImportError:  # Running as a standalone script
+    from timing import phase
+    from rate_limit import acquire, report_throttled
+    from snapshot import get_snapshot
+
 logging.basicConfig(level=logging.INFO)
 
 class LocationAPI:
@@ -8,65 +17,80 @@ class LocationAPI:
     Fetches locations from an external API and returns them as a list of tuples.
     """
     
+    # Used when the API is unavailable (20 major BC cities with latitude/longitude)
+    FALLBACK_CITIES = [
+        ('Vancouver', 49.2827, -123.1207),
+        ('Victoria', 48.4284, -123.3656),
+        ('Burnaby', 49.2488, -122.9805),
+        ('Richmond', 49.1666, -123.1336),
+        ('Surrey', 49.1913, -122.8490),
+        ('Abbotsford', 49.0504, -122.3045),
+        ('Coquitlam', 49.2838, -122.7932),
+        ('Langley', 49.1044, -122.6604),
+        ('Saanich', 48.4840, -123.3810),
+        ('Delta', 49.0847, -123.0586),
+        ('North Vancouver', 49.3200, -123.0724),
+        ('Maple Ridge', 49.2194, -122.6019),
+        ('Nanaimo', 49.1659, -123.9401),
+        ('New Westminster', 49.2057, -122.9110),
+        ('West Vancouver', 49.3270, -123.1662),
+        ('Port Coquitlam', 49.2621, -122.7816),
+        ('White Rock', 49.0253, -122.8029),
+        ('Prince George', 53.9171, -122.7497),
+        ('Chilliwack', 49.1579, -121.9515),
+        ('Kamloops', 50.6745, -120.3273),
+    ]
+    
     @staticmethod
-    def get_locations_from_api():
+    def get_cities_from_api():
         """
-        Fetch locations from the GeoDB API for British Columbia cities
+        Fetch British Columbia cities with their coordinates from the GeoDB API
+        
+        Returns:
+            list: (name, latitude, longitude) tuples, coordinates may be None
         """
         try:
             # Request more cities by adding limit parameter
-            response = requests.get(
-                'http://geodb-free-service.wirefreethought.com/v1/geo/countries/CA/regions/BC/cities?limit=50&minPopulation=1000',
-                timeout=10
-            )
-            response.raise_for_status()  # Raise an error for bad responses
-            data = response.json()
+            acquire('geodb')
+            with phase('locations'):
+                response = requests.get(
+                    'http://geodb-free-service.wirefreethought.com/v1/geo/countries/CA/regions/BC/cities?limit=50&minPopulation=1000',
+                    timeout=10
+                )
+                if response.status_code == 429:
+                    report_throttled('geodb', response.headers.get('Retry-After'))
+                response.raise_for_status()  # Raise an error for bad responses
+                data = response.json()
             
-            # The API returns data in format: {"data": [{"id": 1, "name": "City"}], ...}
-            locations = []
+            # The API returns data in format: {"data": [{"id": 1, "name": "City", "latitude": ..., "longitude": ...}], ...}
+            cities = []
             if 'data' in data:
                 for loc in data['data']:
-                    # Use city name as both value and display text
                     location_name = loc.get('name', 'Unknown')
                     # Only add if we have a valid name
                     if location_name and location_name != 'Unknown':
-                        locations.append((location_name, location_name))
+                        cities.append((location_name, loc.get('latitude'), loc.get('longitude')))
             
-            # Limit to first 20 cities after the empty choice
-            limited_locations = locations[:20]
-            
-            # Add default empty choice at the beginning
-            return [('', 'Select a location')] + limited_locations
+            # Limit to first 20 cities
+            return cities[:20]
         
         except requests.RequestException as e:
             logging.error(f"Error fetching locations: {e}")
-            # Return expanded fallback locations on error (20 major Canadian cities)
-            return [
-                ('', 'Select a location'),
-                ('Vancouver', 'Vancouver'),
-                ('Victoria', 'Victoria'),
-                ('Burnaby', 'Burnaby'),
-                ('Richmond', 'Richmond'),
-                ('Surrey', 'Surrey'),
-                ('Abbotsford', 'Abbotsford'),
-                ('Coquitlam', 'Coquitlam'),
-                ('Langley', 'Langley'),
-                ('Saanich', 'Saanich'),
-                ('Delta', 'Delta'),
-                ('North Vancouver', 'North Vancouver'),
-                ('Maple Ridge', 'Maple Ridge'),
-                ('Nanaimo', 'Nanaimo'),
-                ('New Westminster', 'New Westminster'),
-                ('West Vancouver', 'West Vancouver'),
-                ('Port Coquitlam', 'Port Coquitlam'),
-                ('White Rock', 'White Rock'),
-                ('Prince George', 'Prince George'),
-                ('Chilliwack', 'Chilliwack'),
-                ('Kamloops', 'Kamloops'),
-            ]
+            # Return fallback cities on error
+            return list(LocationAPI.FALLBACK_CITIES)
         except Exception as e:
             logging.error(f"Unexpected error: {e}")
-            return [('', 'Select a location')]
+            return []
+    
+    @staticmethod
+    def get_locations_from_api():
+        """
+        Fetch locations from the GeoDB API for British Columbia cities
+        """
+        cities = LocationAPI.get_cities_from_api()
+        
+        # Use city name as both value and display text, after the default empty choice
+        return [('', 'Select a location')] + [(name, name) for name, latitude, longitude in cities]
 
 def get_locations_from_api():
     """
@@ -74,6 +98,21 @@ def get_locations_from_api():
     """
     return LocationAPI.get_locations_from_api()
 
+def get_cities_from_api():
+    """
+    Function wrapper for easier importing in views
+    """
+    return LocationAPI.get_cities_from_api()
+
+def get_location_choices():
+    """
+    Offered locations, from the reference snapshot when one is loaded
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None and snapshot.count:
+        return snapshot.location_choices()
+    return get_locations_from_api()
+
 if __name__ == "__main__":
     # Example usage
     locations = get_locations_from_api()
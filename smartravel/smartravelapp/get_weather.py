@@ -1,6 +1,15 @@
 import requests
 import logging
 
+try:
+    from .timing import phase
+    from .rate_limit import acquire, report_throttled
+    from .records import WeatherSnapshot
+except ImportError:  # Running as a standalone script
+    from timing import phase
+    from rate_limit import acquire, report_throttled
+    from records import WeatherSnapshot
+
 class WeatherAPI:
     """
     Fetches weather data for a given city using OpenWeatherMap API.
@@ -12,14 +21,39 @@ class WeatherAPI:
     def get_weather(city_name):
         """
         Fetch weather data for a given city.
+        
+        Returns:
+            WeatherSnapshot: Current conditions, or the error if the request failed
         """
         url = f"http://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={WeatherAPI.OPENWEATHERMAP_API_KEY}&units=metric"
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an error for HTTP errors
-            return response.json()
+            acquire('openweathermap')
+            with phase('weather'):
+                response = requests.get(url)
+                if response.status_code == 429:
+                    report_throttled('openweathermap', response.headers.get('Retry-After'))
+                response.raise_for_status()  # Raise an error for HTTP errors
+                return WeatherSnapshot.from_api(response.json())
         except requests.RequestException as e:
             logging.error(f"Error fetching weather data: {e}")
+            return WeatherSnapshot(error=str(e))
+
+    @staticmethod
+    def get_forecast(city_name):
+        """
+        Fetch the 5 day / 3 hour forecast for a given city.
+        """
+        url = f"http://api.openweathermap.org/data/2.5/forecast?q={city_name}&appid={WeatherAPI.OPENWEATHERMAP_API_KEY}&units=metric"
+        try:
+            acquire('openweathermap')
+            with phase('weather'):
+                response = requests.get(url, timeout=10)
+                if response.status_code == 429:
+                    report_throttled('openweathermap', response.headers.get('Retry-After'))
+                response.raise_for_status()  # Raise an error for HTTP errors
+                return response.json()
+        except requests.RequestException as e:
+            logging.error(f"Error fetching forecast data: {e}")
             return {"error": str(e)}
         
 def get_weather(city_name):
@@ -28,6 +62,12 @@ def get_weather(city_name):
     """
     return WeatherAPI.get_weather(city_name)
 
+def get_forecast(city_name):
+    """
+    Function wrapper for easier importing in views
+    """
+    return WeatherAPI.get_forecast(city_name)
+
 if __name__ == "__main__":
     # Example usage
     weather = get_weather("Vancouver")
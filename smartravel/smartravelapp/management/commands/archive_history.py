@@ -0,0 +1,57 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from smartravelapp.archive import archive_histories, get_archive_dir
+from smartravelapp.models import TravelHistory
+
+
+class Command(BaseCommand):
+    help = "Move travel history older than the retention period to compressed, date-partitioned archive files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int,
+            default=getattr(settings, 'SMARTRAVEL_HISTORY_RETENTION_DAYS', 90),
+            help="Archive rows older than this many days (default: SMARTRAVEL_HISTORY_RETENTION_DAYS)."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Rows archived and deleted per batch."
+        )
+        parser.add_argument(
+            '--archive-dir', default=None,
+            help="Archive directory (default: SMARTRAVEL_ARCHIVE_DIR)."
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report how many rows would be archived."
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        cutoff = timezone.now() - datetime.timedelta(days=options['older_than_days'])
+        archive_dir = options['archive_dir'] or get_archive_dir()
+        expired = TravelHistory.objects.filter(time__lt=cutoff).order_by('time', 'id')
+
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} rows older than {cutoff:%Y-%m-%d %H:%M} would be archived.")
+            return
+
+        archived = 0
+        while True:
+            batch = list(expired[:options['batch_size']])
+            if not batch:
+                break
+
+            # Rows are only deleted once their archive files are safely written
+            archive_histories(batch, archive_dir)
+            TravelHistory.objects.filter(pk__in=[history.pk for history in batch]).delete()
+            archived += len(batch)
+            self.stdout.write(f"Archived {archived} rows...")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} rows older than {cutoff:%Y-%m-%d %H:%M} to {archive_dir}."))
@@ -0,0 +1,60 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from smartravelapp.get_directions import DirectionsAPI
+from smartravelapp.get_locations import get_cities_from_api
+from smartravelapp.rate_limit import priority_requests
+from smartravelapp.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped reference snapshot: offered cities, their coordinates and a route duration/distance table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=None,
+            help="Snapshot file to write (default: SMARTRAVEL_SNAPSHOT_PATH)."
+        )
+        parser.add_argument(
+            '--no-matrix', action='store_true',
+            help="Skip the duration/distance table (one matrix request)."
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'SMARTRAVEL_SNAPSHOT_PATH', None)
+        if not path:
+            raise CommandError("No snapshot path given and SMARTRAVEL_SNAPSHOT_PATH is not set.")
+
+        directions_api = DirectionsAPI()
+        cities = []
+        with priority_requests():
+            for name, latitude, longitude in get_cities_from_api():
+                # Prefer the coordinates routing has always used
+                try:
+                    coords = directions_api.geocode_address(name)
+                except requests.RequestException as e:
+                    self.stderr.write(f"Could not geocode {name}: {e}")
+                    coords = None
+                if coords:
+                    longitude, latitude = coords
+
+                if latitude is None or longitude is None:
+                    self.stderr.write(f"Skipping {name}: no coordinates")
+                    continue
+                cities.append((name, latitude, longitude))
+
+            if not cities:
+                raise CommandError("No cities with coordinates available, snapshot not written.")
+
+            durations = distances = None
+            if not options['no_matrix'] and len(cities) > 1:
+                matrix = directions_api.get_duration_matrix([[longitude, latitude] for name, latitude, longitude in cities])
+                if matrix['success']:
+                    durations = matrix['durations']
+                    distances = matrix['distances']
+                else:
+                    self.stderr.write(f"Route table not included: {matrix['error']}")
+
+        write_snapshot(str(path), cities, durations, distances)
+        self.stdout.write(self.style.SUCCESS(f"Wrote reference snapshot with {len(cities)} cities to {path}."))
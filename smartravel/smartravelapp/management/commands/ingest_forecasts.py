@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from smartravelapp.forecast_store import ForecastSeries, get_forecast_store
+from smartravelapp.get_weather import get_forecast
+from smartravelapp.rate_limit import priority_requests
+from smartravelapp.get_locations import get_location_choices
+
+
+class Command(BaseCommand):
+    help = "Fetch the 5 day / 3 hour forecast of every offered city into the local forecast store."
+
+    def handle(self, *args, **options):
+        store = get_forecast_store()
+        cities = [value for value, label in get_location_choices() if value]
+
+        stored = 0
+        with priority_requests():
+            for city in cities:
+                forecast = get_forecast(city)
+                if 'error' in forecast:
+                    self.stderr.write(f"Skipping {city}: {forecast['error']}")
+                    continue
+
+                series = ForecastSeries.from_api(forecast)
+                store.write(city, series)
+                stored += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Stored forecasts for {stored} of {len(cities)} cities in {store.directory}."))
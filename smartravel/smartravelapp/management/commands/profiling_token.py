@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from smartravelapp.middleware import make_profiling_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed token that enables request profiling (X-Smartravel-Profile header or ?profile=)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profiling_token())
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from smartravelapp.models import TravelHistory, RouteStats
+from smartravelapp.records import parse_stored_data
+
+
+class Command(BaseCommand):
+    help = "Rebuild the RouteStats table from the full travel history (e.g. for trips saved before it was added)."
+
+    def handle(self, *args, **options):
+        routes = {}
+        trips = 0
+        histories = TravelHistory.objects.order_by('time').only('start', 'destination', 'directions', 'time')
+        for history in histories.iterator():
+            directions = parse_stored_data(history.directions)
+            if not RouteStats.is_direct(directions):
+                continue
+
+            key = (history.start, history.destination)
+            stats = routes.get(key)
+            if stats is None:
+                stats = routes[key] = RouteStats(start=history.start, destination=history.destination)
+            stats.add_trips(directions, seen_at=history.time)
+            trips += 1
+
+        with transaction.atomic():
+            RouteStats.objects.all().delete()
+            RouteStats.objects.bulk_create(routes.values(), batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {len(routes)} routes from {trips} trips."))
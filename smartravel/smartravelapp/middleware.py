@@ -0,0 +1,181 @@
+import cProfile
+import datetime
+import logging
+import re
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .timing import phase, start_collecting, stop_collecting, format_server_timing
+
+PROFILE_HEADER = 'HTTP_X_SMARTRAVEL_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_SALT = 'smartravelapp.profiling'
+PROFILE_TOKEN_VALUE = 'profile'
+
+
+def make_profiling_token():
+    """
+    Create a signed token that enables profiling for a single request.
+
+    Pass it in the X-Smartravel-Profile header or the ?profile= query flag.
+    """
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign(PROFILE_TOKEN_VALUE)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that adds every query to the 'db' phase.
+    """
+    with phase('db'):
+        return execute(sql, params, many, context)
+
+
+def timing_queries():
+    """
+    Time the queries of every database connection in this thread until the
+    returned context exits.
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(time_query))
+    return stack
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profiler.
+
+    Only active when SMARTRAVEL_PROFILING is True, and only for requests that
+    carry a valid signed token. Profiled requests are run under cProfile, the
+    stats are written to SMARTRAVEL_PROFILING_DIR as a .prof (pstats) file, and
+    a Server-Timing header is added with the time spent in each phase
+    (locations, weather, geocode, route, db, render). The db phase covers
+    every query made while the request is handled.
+
+    Streamed responses stay profiled while their body is generated. Their
+    headers are sent before that work happens, so Server-Timing only covers
+    the time until the response started. The complete timings are logged,
+    and the .prof file is written, once the stream is finished.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SMARTRAVEL_PROFILING', False):
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.output_dir = Path(getattr(settings, 'SMARTRAVEL_PROFILING_DIR', 'profiles'))
+        self.token_max_age = getattr(settings, 'SMARTRAVEL_PROFILING_TOKEN_MAX_AGE', 3600)
+
+    def __call__(self, request):
+        if not self.is_profiling_requested(request):
+            return self.get_response(request)
+
+        timings, token = start_collecting()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this thread
+                profiler = None
+
+            try:
+                with timing_queries():
+                    response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            stop_collecting(token)
+
+        timings['total'] = time.perf_counter() - started
+        response['Server-Timing'] = format_server_timing(timings)
+
+        if response.streaming:
+            response.streaming_content = self.profile_stream(
+                request, response.streaming_content, profiler, timings, started
+            )
+        elif profiler is not None:
+            self.save_profile(request, profiler)
+
+        return response
+
+    def profile_stream(self, request, content, profiler, timings, started):
+        """
+        Yield the chunks of a streamed response, profiling and collecting
+        phase timings while each one is produced.
+        """
+        content = iter(content)
+        try:
+            while True:
+                timings, token = start_collecting(timings)
+                try:
+                    if profiler is not None:
+                        try:
+                            profiler.enable()
+                        except ValueError:
+                            # Another profiler is already active in this thread
+                            profiler = None
+                    try:
+                        with timing_queries():
+                            chunk = next(content)
+                    except StopIteration:
+                        return
+                    finally:
+                        if profiler is not None:
+                            profiler.disable()
+                finally:
+                    stop_collecting(token)
+                yield chunk
+        finally:
+            if hasattr(content, 'close'):
+                content.close()
+
+            timings.pop('total', None)
+            timings['total'] = time.perf_counter() - started
+            logging.info(f"Streamed {request.method} {request.path} Server-Timing: {format_server_timing(timings)}")
+            if profiler is not None:
+                self.save_profile(request, profiler)
+
+    def is_profiling_requested(self, request):
+        """
+        Check whether the request carries a valid, unexpired profiling token.
+        """
+        value = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_QUERY_PARAM)
+        if not value:
+            return False
+
+        try:
+            signed_value = signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+                value, max_age=self.token_max_age
+            )
+        except signing.BadSignature:
+            logging.warning(f"Rejected profiling token for {request.path}")
+            return False
+
+        return signed_value == PROFILE_TOKEN_VALUE
+
+    def save_profile(self, request, profiler):
+        """
+        Dump the profiler stats to a pstats file in the output directory.
+
+        The file can be explored with pstats/snakeviz or turned into a
+        flamegraph with flameprof.
+        """
+        timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path_slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        filename = f"{timestamp}-{request.method.lower()}-{path_slug}.prof"
+
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(self.output_dir / filename))
+            logging.info(f"Saved request profile to {self.output_dir / filename}")
+        except OSError as e:
+            logging.error(f"Error saving request profile: {e}")
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-19 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartravelapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('trip_count', models.PositiveIntegerField(default=0)),
+                ('routed_count', models.PositiveIntegerField(default=0)),
+                ('last_seen', models.DateTimeField(null=True)),
+                ('sum_duration', models.FloatField(default=0)),
+                ('min_duration', models.FloatField(null=True)),
+                ('max_duration', models.FloatField(null=True)),
+                ('sum_distance', models.FloatField(default=0)),
+                ('min_distance', models.FloatField(null=True)),
+                ('max_distance', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='routestats',
+            index=models.Index(fields=['-trip_count'], name='smartravela_trip_co_dc90f1_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='routestats',
+            unique_together={('start', 'destination')},
+        ),
+    ]
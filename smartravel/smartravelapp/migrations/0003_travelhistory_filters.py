@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 04:40
+
+from django.db import migrations, models
+
+
+def backfill_directions_ok(apps, schema_editor):
+    # Directions are stored as str(dict), so successful ones contain this literal
+    TravelHistory = apps.get_model('smartravelapp', 'TravelHistory')
+    TravelHistory.objects.filter(directions__contains="'success': True").update(directions_ok=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartravelapp', '0002_routestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='travelhistory',
+            name='directions_ok',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_directions_ok, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='travelhistory',
+            index=models.Index(fields=['start', 'destination', '-time'], name='smartravela_start_8a3b3d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='travelhistory',
+            index=models.Index(fields=['destination', '-time'], name='smartravela_destina_e44ac7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='travelhistory',
+            index=models.Index(fields=['directions_ok', '-time'], name='smartravela_directi_39ef5e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='travelhistory',
+            index=models.Index(fields=['-time'], name='smartravela_time_d35db3_idx'),
+        ),
+    ]
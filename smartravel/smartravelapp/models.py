@@ -1,4 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .records import RouteSummary
 
 # Create your models here.
 class TravelHistory(models.Model):
@@ -7,7 +11,166 @@ class TravelHistory(models.Model):
     start_weather = models.TextField()
     destination_weather = models.TextField()  
     directions = models.TextField()
+    # Whether directions were found, so history can be filtered without parsing the blob
+    directions_ok = models.BooleanField(default=False)
     time = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['start', 'destination', '-time']),
+            models.Index(fields=['destination', '-time']),
+            models.Index(fields=['directions_ok', '-time']),
+            models.Index(fields=['-time']),
+        ]
+
     def __str__(self):
-        return f"{self.start} to {self.destination} - {self.time}"
\ No newline at end of file
+        return f"{self.start} to {self.destination} - {self.time}"
+
+class RouteStats(models.Model):
+    """
+    Running trip statistics per (start, destination) pair, kept up to date
+    as trips are saved so dashboards never have to scan TravelHistory.
+    """
+    start = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    trip_count = models.PositiveIntegerField(default=0)
+    # Trips that got directions; duration/distance stats only cover these
+    routed_count = models.PositiveIntegerField(default=0)
+    last_seen = models.DateTimeField(null=True)
+    # Totals over routed trips; the means are derived from them
+    sum_duration = models.FloatField(default=0)  # in seconds
+    min_duration = models.FloatField(null=True)
+    max_duration = models.FloatField(null=True)
+    sum_distance = models.FloatField(default=0)  # in meters
+    min_distance = models.FloatField(null=True)
+    max_distance = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = [('start', 'destination')]
+        indexes = [models.Index(fields=['-trip_count'])]
+
+    def __str__(self):
+        return f"{self.start} to {self.destination} - {self.trip_count} trips"
+
+    @property
+    def mean_duration(self):
+        return self.sum_duration / self.routed_count if self.routed_count else None
+
+    @property
+    def mean_distance(self):
+        return self.sum_distance / self.routed_count if self.routed_count else None
+
+    @staticmethod
+    def is_direct(directions):
+        """
+        Whether a directions result (RouteSummary or stored dict) is a direct
+        trip. Multi-stop trips are not counted in the stats of their end points.
+        """
+        stops = directions.get('stops') if isinstance(directions, dict) else getattr(directions, 'stops', None)
+        return not stops or len(stops) <= 2
+
+    @staticmethod
+    def _route_totals(directions):
+        """
+        (duration, distance) of a successful directions result, or None.
+
+        directions is a RouteSummary, or a stored directions dict.
+        """
+        if isinstance(directions, dict):
+            directions = RouteSummary.from_dict(directions)
+        if not isinstance(directions, RouteSummary) or not directions.success:
+            return None
+        return float(directions.duration or 0), float(directions.distance or 0)
+
+    def add_trips(self, directions, count=1, seen_at=None):
+        """
+        Fold `count` trips with the same directions result into this
+        in-memory row, e.g. while rebuilding the table. Use record_trips()
+        to update saved rows.
+        """
+        seen_at = seen_at or timezone.now()
+        self.trip_count += count
+        if self.last_seen is None or seen_at > self.last_seen:
+            self.last_seen = seen_at
+
+        totals = self._route_totals(directions)
+        if totals is None:
+            return
+
+        duration, distance = totals
+        self.routed_count += count
+        self.sum_duration += duration * count
+        self.sum_distance += distance * count
+        self.min_duration = duration if self.min_duration is None else min(self.min_duration, duration)
+        self.max_duration = duration if self.max_duration is None else max(self.max_duration, duration)
+        self.min_distance = distance if self.min_distance is None else min(self.min_distance, distance)
+        self.max_distance = distance if self.max_distance is None else max(self.max_distance, distance)
+
+    @classmethod
+    def record_trips(cls, start, destination, directions, count=1, seen_at=None):
+        """
+        Update the stats of a route after `count` trips were saved for it.
+        Multi-stop trips are ignored (see is_direct()).
+
+        Counts and totals are incremented and min/max/last_seen only ever
+        moved in the database with conditional updates, so concurrent
+        workers never overwrite each other's trips.
+
+        Args:
+            start (str): Starting location
+            destination (str): Destination location
+            directions (RouteSummary): Directions result shared by the trips
+            count (int): Number of trips
+            seen_at (datetime): When the trips were made (defaults to now)
+        """
+        if not cls.is_direct(directions):
+            return None
+
+        seen_at = seen_at or timezone.now()
+        totals = cls._route_totals(directions)
+
+        with transaction.atomic():
+            stats, created = cls.objects.get_or_create(start=start, destination=destination)
+            route = cls.objects.filter(pk=stats.pk)
+
+            changes = {'trip_count': F('trip_count') + count}
+            if totals is not None:
+                duration, distance = totals
+                changes.update(
+                    routed_count=F('routed_count') + count,
+                    sum_duration=F('sum_duration') + duration * count,
+                    sum_distance=F('sum_distance') + distance * count
+                )
+            route.update(**changes)
+
+            route.filter(Q(last_seen__isnull=True) | Q(last_seen__lt=seen_at)).update(last_seen=seen_at)
+            if totals is not None:
+                route.filter(Q(min_duration__isnull=True) | Q(min_duration__gt=duration)).update(min_duration=duration)
+                route.filter(Q(max_duration__isnull=True) | Q(max_duration__lt=duration)).update(max_duration=duration)
+                route.filter(Q(min_distance__isnull=True) | Q(min_distance__gt=distance)).update(min_distance=distance)
+                route.filter(Q(max_distance__isnull=True) | Q(max_distance__lt=distance)).update(max_distance=distance)
+
+        stats.refresh_from_db()
+        return stats
+
+    @classmethod
+    def hot_routes(cls, limit=10):
+        """
+        The most travelled routes, e.g. to decide which ones to keep cached.
+        """
+        return cls.objects.order_by('-trip_count')[:limit]
+
+    def as_dict(self):
+        return {
+            'start': self.start,
+            'destination': self.destination,
+            'trip_count': self.trip_count,
+            'routed_count': self.routed_count,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'mean_duration': self.mean_duration,
+            'min_duration': self.min_duration,
+            'max_duration': self.max_duration,
+            'mean_distance': self.mean_distance,
+            'min_distance': self.min_distance,
+            'max_distance': self.max_distance,
+        }
@@ -0,0 +1,221 @@
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; buckets are then per-process
+    fcntl = None
+
+# Free-tier quotas of the upstream APIs.
+#   rate:      tokens added per second
+#   capacity:  maximum burst size
+#   reserve:   tokens only priority callers (cache refresh jobs) may use
+#   policy:    'queue' waits up to max_wait seconds for a token, 'reject' fails at once
+DEFAULT_RATE_LIMITS = {
+    'geodb': {'rate': 1.0, 'capacity': 1, 'reserve': 0, 'policy': 'queue', 'max_wait': 5},
+    'openweathermap': {'rate': 1.0, 'capacity': 60, 'reserve': 5, 'policy': 'queue', 'max_wait': 5},
+    'ors_geocode': {'rate': 100 / 60, 'capacity': 100, 'reserve': 10, 'policy': 'queue', 'max_wait': 5},
+    'ors_directions': {'rate': 40 / 60, 'capacity': 40, 'reserve': 4, 'policy': 'queue', 'max_wait': 10},
+    'ors_matrix': {'rate': 40 / 60, 'capacity': 40, 'reserve': 4, 'policy': 'queue', 'max_wait': 10},
+}
+
+# Bucket state on disk: tokens, last refill time
+_STATE = struct.Struct('<dd')
+
+_priority = ContextVar('smartravel_rate_limit_priority', default=False)
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+class RateLimitExceeded(requests.RequestException):
+    """
+    Raised when no token is available for an upstream call.
+
+    Subclasses RequestException so the API classes handle it like any
+    other failed request.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every process on the host through a locked state file.
+    """
+
+    def __init__(self, name, rate, capacity, reserve=0, policy='queue', max_wait=5, state_dir=None):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.reserve = min(float(reserve), self.capacity - 1)
+        self.policy = policy
+        self.max_wait = max_wait
+        self.state_dir = state_dir or os.path.join(tempfile.gettempdir(), 'smartravel-ratelimit')
+        self.path = os.path.join(self.state_dir, f"{name}.bucket")
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked_state(self):
+        """
+        Lock the bucket across threads and processes and yield its state file.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._thread_lock:
+            with open(self.path, 'a+b') as state_file:
+                if fcntl is not None:
+                    fcntl.flock(state_file, fcntl.LOCK_EX)
+                try:
+                    yield state_file
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(state_file, fcntl.LOCK_UN)
+
+    def _read(self, state_file, now):
+        state_file.seek(0)
+        data = state_file.read(_STATE.size)
+        if len(data) < _STATE.size:
+            # New bucket starts full
+            return self.capacity, now
+        return _STATE.unpack(data)
+
+    def _write(self, state_file, tokens, updated_at):
+        state_file.seek(0)
+        state_file.truncate()
+        state_file.write(_STATE.pack(tokens, updated_at))
+        state_file.flush()
+
+    def _try_take(self, floor):
+        """
+        Take one token if that leaves at least `floor` tokens.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one should be available
+        """
+        with self._locked_state() as state_file:
+            now = time.time()
+            tokens, updated_at = self._read(state_file, now)
+            tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+
+            if tokens - 1 >= floor:
+                self._write(state_file, tokens - 1, now)
+                return 0
+
+            self._write(state_file, tokens, now)
+            return (floor + 1 - tokens) / self.rate
+
+    def acquire(self, priority=None, policy=None, max_wait=None):
+        """
+        Take a token for one upstream call, waiting or failing per the policy.
+
+        Args:
+            priority (bool): Allow using the reserved tokens (defaults to the
+                             current priority_requests() scope)
+            policy (str): 'queue' or 'reject' (defaults to the bucket's policy)
+            max_wait (float): Longest time to queue for, in seconds
+
+        Raises:
+            RateLimitExceeded: If no token is available in time
+        """
+        if priority is None:
+            priority = _priority.get()
+        policy = policy or self.policy
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        floor = 0 if priority else self.reserve
+        deadline = time.monotonic() + max_wait
+
+        while True:
+            wait = self._try_take(floor)
+            if wait == 0:
+                return
+
+            if policy == 'reject' or time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Rate limit reached for {self.name}, retry in {wait:.1f}s")
+            time.sleep(wait)
+
+    def throttle(self, seconds):
+        """
+        Empty the bucket so no process calls the upstream for `seconds`.
+
+        Used when the upstream answers 429 despite the limiter, e.g. because
+        the quota is shared with something else.
+        """
+        with self._locked_state() as state_file:
+            self._write(state_file, -seconds * self.rate, time.time())
+        logging.warning(f"Upstream {self.name} throttled us, pausing calls for {seconds:.0f}s")
+
+
+def _load_settings():
+    """
+    Read rate limit overrides from Django settings when they are available.
+    """
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return (
+                getattr(settings, 'SMARTRAVEL_RATE_LIMITS', {}),
+                getattr(settings, 'SMARTRAVEL_RATE_LIMIT_DIR', None)
+            )
+    except ImportError:
+        pass
+    return {}, None
+
+
+def get_bucket(name):
+    """
+    Get the shared token bucket for an upstream.
+    """
+    bucket = _buckets.get(name)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(name)
+            if bucket is None:
+                overrides, state_dir = _load_settings()
+                config = dict(DEFAULT_RATE_LIMITS.get(name, {'rate': 1.0, 'capacity': 1}))
+                config.update(overrides.get(name, {}))
+                bucket = TokenBucket(name, state_dir=str(state_dir) if state_dir else None, **config)
+                _buckets[name] = bucket
+    return bucket
+
+
+def acquire(name, **kwargs):
+    """
+    Take a token for one call to the named upstream. See TokenBucket.acquire().
+    """
+    get_bucket(name).acquire(**kwargs)
+
+
+def report_throttled(name, retry_after=None):
+    """
+    Pause the named upstream after it answered 429 Too Many Requests.
+
+    Args:
+        name (str): Upstream name
+        retry_after (str): Retry-After header value in seconds, if any
+    """
+    try:
+        seconds = float(retry_after) if retry_after else 60.0
+    except ValueError:
+        seconds = 60.0
+    get_bucket(name).throttle(seconds)
+
+
+@contextmanager
+def priority_requests():
+    """
+    Let upstream calls in this block use the reserved tokens.
+
+    Cache refresh jobs should run inside this so they keep working while
+    user traffic has used up the normal share of the quota.
+    """
+    token = _priority.set(True)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
@@ -0,0 +1,180 @@
+import ast
+import json
+
+
+def parse_stored_data(data_string):
+    """
+    Parse stored JSON string data safely
+    """
+    if isinstance(data_string, dict):
+        return data_string
+    
+    if data_string is None or data_string == '':
+        return {}
+    
+    if isinstance(data_string, str):
+        try:
+            # Rows are stored as str(dict), so they parse as Python literals
+            return ast.literal_eval(data_string)
+        except (ValueError, TypeError, SyntaxError) as e:
+            error = e
+
+        if data_string.startswith('{') or data_string.startswith('['):
+            try:
+                # Fall back to JSON, cleaning up Python quotes and booleans
+                clean_string = data_string.replace("'", '"').replace('True', 'true').replace('False', 'false')
+                return json.loads(clean_string)
+            except json.JSONDecodeError as e:
+                error = e
+
+        # If parsing fails, return error dict
+        return {'error': f'Data parsing failed: {str(error)}'}
+    
+    return data_string
+
+
+class WeatherSnapshot:
+    """
+    The parts of an OpenWeatherMap current weather response the app uses.
+
+    Built once where the API is called, so formatters and the recommender
+    read plain attributes instead of digging through the nested JSON, and
+    caches hold a few slots instead of the whole response.
+    """
+
+    __slots__ = ('name', 'temp', 'humidity', 'condition', 'description', 'error')
+
+    def __init__(self, name=None, temp=None, humidity=None, condition=None, description=None, error=None):
+        self.name = name
+        self.temp = temp
+        self.humidity = humidity
+        self.condition = condition
+        self.description = description
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return f"WeatherSnapshot(error={self.error!r})"
+        return f"WeatherSnapshot(name={self.name!r}, temp={self.temp!r}, condition={self.condition!r})"
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @classmethod
+    def from_api(cls, weather_data):
+        """
+        Build a snapshot from an API response, or a stored dict in the same format.
+        """
+        if 'error' in weather_data:
+            return cls(error=str(weather_data['error']))
+
+        main = weather_data.get('main', {})
+        weather = (weather_data.get('weather') or [{}])[0]
+        return cls(
+            name=weather_data.get('name'),
+            temp=main.get('temp'),
+            humidity=main.get('humidity'),
+            condition=weather.get('main'),
+            description=weather.get('description')
+        )
+
+    def as_dict(self):
+        """
+        A compact dict in the API response format, used when storing the snapshot.
+        """
+        if self.error is not None:
+            return {'error': self.error}
+
+        data = {}
+        if self.name is not None:
+            data['name'] = self.name
+        main = {key: value for key, value in (('temp', self.temp), ('humidity', self.humidity)) if value is not None}
+        if main:
+            data['main'] = main
+        weather = {key: value for key, value in (('main', self.condition), ('description', self.description)) if value is not None}
+        if weather:
+            data['weather'] = [weather]
+        return data
+
+
+class RouteSummary:
+    """
+    The result of a directions request: totals and step instructions only.
+
+    Steps are (instruction, distance meters) tuples and legs are (duration
+    seconds, distance meters) tuples. Failed requests only carry an error.
+    """
+
+    __slots__ = ('success', 'origin', 'destination', 'duration', 'distance', 'steps', 'legs', 'stops', 'error', 'raw_data')
+
+    def __init__(self, success, origin=None, destination=None, duration=0, distance=0,
+                 steps=(), legs=None, stops=None, error=None, raw_data=None):
+        self.success = success
+        self.origin = origin
+        self.destination = destination
+        self.duration = duration  # in seconds
+        self.distance = distance  # in meters
+        self.steps = tuple(steps)
+        self.legs = tuple(legs) if legs else None
+        self.stops = tuple(stops) if stops else None
+        self.error = error
+        self.raw_data = raw_data
+
+    def __repr__(self):
+        if not self.success:
+            return f"RouteSummary(error={self.error!r})"
+        return f"RouteSummary(origin={self.origin!r}, destination={self.destination!r}, duration={self.duration!r}, distance={self.distance!r})"
+
+    @classmethod
+    def failure(cls, error):
+        return cls(False, error=error)
+
+    @classmethod
+    def from_dict(cls, directions_data):
+        """
+        Build a summary from a stored directions dict (see as_dict()).
+        """
+        if not directions_data.get('success', False):
+            return cls.failure(directions_data.get('error', 'Unknown error'))
+
+        return cls(
+            True,
+            origin=directions_data.get('origin'),
+            destination=directions_data.get('destination'),
+            duration=directions_data.get('duration', 0),
+            distance=directions_data.get('distance', 0),
+            steps=[
+                (step.get('instruction', 'N/A'), step.get('distance', 0))
+                for step in directions_data.get('steps', [])
+            ],
+            legs=[(leg.get('duration', 0), leg.get('distance', 0)) for leg in directions_data.get('legs', [])],
+            stops=directions_data.get('stops'),
+            raw_data=directions_data.get('raw_data')
+        )
+
+    def as_dict(self):
+        """
+        The directions dict format that is stored in TravelHistory.
+        """
+        if not self.success:
+            return {'success': False, 'error': self.error}
+
+        data = {
+            'success': True,
+            'origin': self.origin,
+            'destination': self.destination,
+            'duration': self.duration,
+            'distance': self.distance,
+            'steps': [
+                {'instruction': instruction, 'distance': distance}
+                for instruction, distance in self.steps
+            ]
+        }
+        if self.legs:
+            data['legs'] = [{'duration': duration, 'distance': distance} for duration, distance in self.legs]
+        if self.stops:
+            data['stops'] = list(self.stops)
+        if self.raw_data is not None:
+            data['raw_data'] = self.raw_data
+        return data
@@ -0,0 +1,213 @@
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+
+# File layout (little-endian):
+#   header     magic, version, city count, then byte offsets/lengths of each block
+#   names      UTF-8 city names separated by NUL bytes
+#   coords     city_count x 2 float64: latitude, longitude
+#   durations  city_count x city_count float32 seconds, NaN when unknown
+#   distances  city_count x city_count float32 meters, NaN when unknown
+SNAPSHOT_MAGIC = b'STRVSNAP'
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct('<8sII5Q')
+
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+def write_snapshot(path, cities, durations=None, distances=None):
+    """
+    Write a reference data snapshot.
+
+    The file is written next to the target and renamed into place, so workers
+    that still map the previous snapshot keep reading a consistent file.
+
+    Args:
+        path (str): Snapshot file path
+        cities (list): (name, latitude, longitude) tuples
+        durations (list): Square matrix of seconds indexed like cities, None for unknown
+        distances (list): Square matrix of meters indexed like cities, None for unknown
+    """
+    count = len(cities)
+    names = b'\0'.join(name.encode('utf-8') for name, latitude, longitude in cities)
+
+    names_offset = _HEADER.size
+    coords_offset = _align(names_offset + len(names))
+    durations_offset = coords_offset + count * 2 * 8
+    distances_offset = durations_offset + count * count * 4
+
+    def flatten(matrix):
+        values = []
+        for i in range(count):
+            for j in range(count):
+                value = matrix[i][j] if matrix is not None else None
+                values.append(math.nan if value is None else value)
+        return values
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as snapshot:
+        snapshot.write(_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count,
+            names_offset, len(names), coords_offset, durations_offset, distances_offset
+        ))
+        snapshot.write(names)
+        snapshot.write(b'\0' * (coords_offset - names_offset - len(names)))
+        coords = []
+        for name, latitude, longitude in cities:
+            coords.extend([latitude, longitude])
+        snapshot.write(struct.pack(f'<{count * 2}d', *coords))
+        snapshot.write(struct.pack(f'<{count * count}f', *flatten(durations)))
+        snapshot.write(struct.pack(f'<{count * count}f', *flatten(distances)))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temporary_path, path)
+
+
+class ReferenceSnapshot:
+    """
+    Read-only, memory-mapped view of a reference data snapshot.
+
+    Coordinates and the pair tables are memoryviews straight over the mapping,
+    so every worker process shares the same page-cache copy.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as snapshot:
+            self._mmap = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        (magic, version, count, names_offset, names_length,
+         coords_offset, durations_offset, distances_offset) = _HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{self.path} is not a version {SNAPSHOT_VERSION} reference snapshot")
+
+        self.count = count
+        names = bytes(view[names_offset:names_offset + names_length]).decode('utf-8')
+        self.names = names.split('\0') if count else []
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+        self.coordinates = view[coords_offset:coords_offset + count * 2 * 8].cast('d')
+        self.durations = view[durations_offset:durations_offset + count * count * 4].cast('f')
+        self.distances = view[distances_offset:distances_offset + count * count * 4].cast('f')
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def cities(self):
+        """
+        List the cities as (name, latitude, longitude) tuples.
+        """
+        return [
+            (name, self.coordinates[2 * i], self.coordinates[2 * i + 1])
+            for i, name in enumerate(self.names)
+        ]
+
+    def location_choices(self):
+        """
+        Form choices in the same format as get_locations_from_api().
+        """
+        return [('', 'Select a location')] + [(name, name) for name in self.names]
+
+    def coordinates_of(self, name):
+        """
+        Get [longitude, latitude] of a city, as DirectionsAPI.geocode_address() returns.
+        """
+        i = self._index.get(name)
+        if i is None:
+            return None
+        return [self.coordinates[2 * i + 1], self.coordinates[2 * i]]
+
+    def pair(self, start, destination):
+        """
+        Get the precomputed (duration seconds, distance meters) of a route, or None.
+        """
+        i = self._index.get(start)
+        j = self._index.get(destination)
+        if i is None or j is None:
+            return None
+
+        duration = self.durations[i * self.count + j]
+        distance = self.distances[i * self.count + j]
+        if math.isnan(duration):
+            return None
+        return duration, (None if math.isnan(distance) else distance)
+
+    def duration_matrix(self, names):
+        """
+        Get a duration matrix for the given cities, or None if any pair is unknown.
+        """
+        indexes = [self._index.get(name) for name in names]
+        if None in indexes:
+            return None
+
+        matrix = [
+            [self.durations[i * self.count + j] for j in indexes]
+            for i in indexes
+        ]
+        if any(math.isnan(value) for row in matrix for value in row):
+            return None
+        return matrix
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot_path():
+    """
+    Read the snapshot path from Django settings when they are available.
+    """
+    try:
+        from django.conf import settings
+        if settings.configured:
+            path = getattr(settings, 'SMARTRAVEL_SNAPSHOT_PATH', None)
+            return str(path) if path else None
+    except ImportError:
+        pass
+    return None
+
+
+def load_snapshot(path=None):
+    """
+    Memory-map the reference snapshot and make it the process-wide one.
+
+    Returns:
+        ReferenceSnapshot: The loaded snapshot, or None if there is no usable file
+    """
+    global _snapshot
+    path = path or get_snapshot_path()
+    if not path or not os.path.exists(path):
+        return None
+
+    try:
+        snapshot = ReferenceSnapshot(path)
+    except (OSError, ValueError, struct.error) as e:
+        logging.error(f"Error loading reference snapshot {path}: {e}")
+        return None
+
+    with _snapshot_lock:
+        _snapshot = snapshot
+
+    # Seed the geocode cache so offered cities are never geocoded remotely
+    try:
+        from .get_directions import DirectionsAPI
+    except ImportError:  # Running as a standalone script
+        from get_directions import DirectionsAPI
+    for name in snapshot.names:
+        DirectionsAPI._geocode_cache.setdefault(name, snapshot.coordinates_of(name))
+
+    logging.info(f"Loaded reference snapshot with {snapshot.count} cities from {path}")
+    return snapshot
+
+
+def get_snapshot():
+    """
+    Get the process-wide reference snapshot, or None if none is loaded.
+    """
+    return _snapshot
@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+
+try:
+    from .get_locations import get_cities_from_api
+    from .snapshot import get_snapshot
+except ImportError:  # Running as a standalone script
+    from get_locations import get_cities_from_api
+    from snapshot import get_snapshot
+
+EARTH_RADIUS_KM = 6371.0088
+
+# How long the offered cities index is reused before the city list is fetched again
+INDEX_TTL_SECONDS = 3600
+
+
+def _to_unit_vector(latitude, longitude):
+    """
+    Convert latitude/longitude in degrees to a point on the unit sphere.
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord):
+    """
+    Convert a straight-line distance between unit vectors to great-circle km.
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(distance_km):
+    return 2 * math.sin(min(math.pi, distance_km / EARTH_RADIUS_KM) / 2)
+
+
+class CityIndex:
+    """
+    KD-tree over city coordinates for nearest-city and within-radius lookups.
+
+    Cities are stored as 3D points on the unit sphere, where straight-line
+    distance grows with great-circle distance, so an ordinary KD-tree gives
+    exact geographic answers with no special handling near the poles or the
+    antimeridian.
+    """
+
+    def __init__(self, cities):
+        """
+        Args:
+            cities (list): (name, latitude, longitude) tuples; cities without
+                           coordinates are skipped
+        """
+        self.cities = [
+            (name, float(latitude), float(longitude))
+            for name, latitude, longitude in cities
+            if latitude is not None and longitude is not None
+        ]
+        points = [
+            (_to_unit_vector(latitude, longitude), i)
+            for i, (name, latitude, longitude) in enumerate(self.cities)
+        ]
+        self._root = self._build(points, 0)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def _build(self, points, axis):
+        """
+        Build a subtree as [point, city index, axis, left, right].
+        """
+        if not points:
+            return None
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        point, index = points[middle]
+        next_axis = (axis + 1) % 3
+        return [
+            point, index, axis,
+            self._build(points[:middle], next_axis),
+            self._build(points[middle + 1:], next_axis)
+        ]
+
+    def _result(self, index, chord):
+        name, latitude, longitude = self.cities[index]
+        return {
+            'name': name,
+            'latitude': latitude,
+            'longitude': longitude,
+            'distance_km': round(_chord_to_km(chord), 3)
+        }
+
+    def nearest(self, latitude, longitude):
+        """
+        Find the city closest to a coordinate.
+
+        Returns:
+            dict: name, latitude, longitude and distance_km, or None if the index is empty
+        """
+        if self._root is None:
+            return None
+
+        target = _to_unit_vector(latitude, longitude)
+        best = [None, float('inf')]  # city index, squared chord
+
+        def search(node):
+            if node is None:
+                return
+            point, index, axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if distance < best[1]:
+                best[0], best[1] = index, distance
+
+            offset = target[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            search(near)
+            if offset * offset < best[1]:
+                search(far)
+
+        search(self._root)
+        return self._result(best[0], math.sqrt(best[1]))
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Find every city within radius_km of a coordinate.
+
+        Returns:
+            list: dicts like nearest(), closest first
+        """
+        target = _to_unit_vector(latitude, longitude)
+        limit = _km_to_chord(radius_km) ** 2
+        found = []
+
+        def search(node):
+            if node is None:
+                return
+            point, index, axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if distance <= limit:
+                found.append((distance, index))
+
+            offset = target[axis] - point[axis]
+            if offset < 0 or offset * offset <= limit:
+                search(left)
+            if offset >= 0 or offset * offset <= limit:
+                search(right)
+
+        search(self._root)
+        found.sort()
+        return [self._result(index, math.sqrt(distance)) for distance, index in found]
+
+
+_index = None
+_index_built_at = 0
+_index_lock = threading.Lock()
+
+
+def get_city_index():
+    """
+    Get the index of offered cities, rebuilding it once INDEX_TTL_SECONDS have passed.
+    """
+    global _index, _index_built_at
+    if _index is None or time.monotonic() - _index_built_at > INDEX_TTL_SECONDS:
+        with _index_lock:
+            if _index is None or time.monotonic() - _index_built_at > INDEX_TTL_SECONDS:
+                snapshot = get_snapshot()
+                if snapshot is not None and snapshot.count:
+                    _index = CityIndex(snapshot.cities())
+                else:
+                    _index = CityIndex(get_cities_from_api())
+                # Try again on the next call if the city list could not be fetched
+                _index_built_at = time.monotonic() if len(_index) else float('-inf')
+    return _index
@@ -1,3 +1,1051 @@
-from django.test import TestCase
+import datetime
+import importlib
+import array
+import io
+import itertools
+import json
+import math
+import os
+import pstats
+import random
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import requests
+import urllib3
+from django.apps import apps
+from django.core import signing
+from django.core.management import call_command, CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .trip_planner import path_cost, nearest_neighbour_order, two_opt, solve_stop_order
+from .spatial_index import CityIndex, EARTH_RADIUS_KM
+from .rate_limit import TokenBucket, RateLimitExceeded, priority_requests
+from .snapshot import write_snapshot, ReferenceSnapshot
+from .forecast_store import ForecastSeries, ForecastStore, SLOT_SECONDS
+from .departure_planner import plan_departures
+from .archive import iter_archived_history
+from .middleware import make_profiling_token
+from .models import TravelHistory, RouteStats
+from .views import filter_histories, format_weather_for_history, format_directions_for_history
+from . import get_directions
+from .get_directions import DirectionsAPI
+from .records import WeatherSnapshot, RouteSummary, parse_stored_data
 
 # Create your tests here.
+
+def random_matrix(rng, size, asymmetry=0.3):
+    """
+    Cost matrix of random points in a unit square, skewed so a -> b != b -> a.
+    """
+    points = [(rng.random(), rng.random()) for _ in range(size)]
+    return [
+        [
+            0 if a == b else ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5 * (1 + asymmetry * rng.random())
+            for b in points
+        ]
+        for a in points
+    ]
+
+
+def brute_force_cost(matrix, start, end):
+    """
+    Cost of the cheapest order through every stop, by trying them all.
+    """
+    middle = [i for i in range(len(matrix)) if i != start and i != end]
+    tail = [end] if end is not None else []
+    return min(path_cost([start, *order, *tail], matrix) for order in itertools.permutations(middle))
+
+
+class StopOrderTests(SimpleTestCase):
+
+    def assertValidOrder(self, order, size, start, end):
+        self.assertEqual(sorted(order), list(range(size)))
+        self.assertEqual(order[0], start)
+        if end is not None:
+            self.assertEqual(order[-1], end)
+
+    def test_orders_are_valid_with_fixed_start_and_end(self):
+        rng = random.Random(1)
+        for size in range(2, 12):
+            matrix = random_matrix(rng, size)
+            for start, end in [(0, None), (0, size - 1), (size - 1, 0), (size // 2, None)]:
+                if start == end:
+                    continue
+                with self.subTest(size=size, start=start, end=end):
+                    self.assertValidOrder(solve_stop_order(matrix, start, end), size, start, end)
+
+    def test_close_to_brute_force(self):
+        rng = random.Random(2)
+        for size in range(2, 9):
+            for trial in range(20):
+                matrix = random_matrix(rng, size)
+                for end in (None, size - 1):
+                    with self.subTest(size=size, trial=trial, end=end):
+                        best = brute_force_cost(matrix, 0, end)
+                        cost = path_cost(solve_stop_order(matrix, 0, end), matrix)
+                        self.assertGreaterEqual(cost, best - 1e-9)
+                        self.assertLessEqual(cost, best * 1.5 + 1e-9)
+
+    def test_finds_the_optimum_on_a_line(self):
+        # Stops on a line, listed out of order: the only good order is left to right
+        positions = [0, 7, 3, 9, 1, 5]
+        matrix = [[abs(a - b) for b in positions] for a in positions]
+        order = solve_stop_order(matrix, 0, None)
+        self.assertEqual([positions[i] for i in order], [0, 1, 3, 5, 7, 9])
+
+    def test_two_opt_leaves_no_improving_reversal(self):
+        rng = random.Random(3)
+        for size in range(4, 14):
+            matrix = random_matrix(rng, size)
+            for fixed_end in (False, True):
+                with self.subTest(size=size, fixed_end=fixed_end):
+                    end = size - 1 if fixed_end else None
+                    order = two_opt(nearest_neighbour_order(matrix, 0, end), matrix, fixed_end=fixed_end)
+                    cost = path_cost(order, matrix)
+                    last_movable = size - (2 if fixed_end else 1)
+                    for i in range(1, last_movable):
+                        for j in range(i + 1, last_movable + 1):
+                            reversed_order = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                            self.assertGreaterEqual(path_cost(reversed_order, matrix), cost - 1e-9)
+
+    def test_avoids_unroutable_pairs(self):
+        # 0 -> 2 is unroutable, so 2 has to come after 1
+        matrix = [
+            [0, 5, None],
+            [5, 0, 1],
+            [1, 1, 0],
+        ]
+        self.assertEqual(solve_stop_order(matrix, 0, None), [0, 1, 2])
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CityIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(4)
+        self.cities = [
+            (f"City {i}", rng.uniform(-90, 90), rng.uniform(-180, 180))
+            for i in range(300)
+        ]
+        # Cities near the poles and on both sides of the antimeridian
+        self.cities += [
+            ('North', 89.9, 10.0), ('South', -89.9, -170.0),
+            ('East', 10.0, 179.95), ('West', 10.0, -179.95),
+        ]
+        self.index = CityIndex(self.cities)
+        self.queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(200)]
+        self.queries += [(90.0, 0.0), (-90.0, 0.0), (10.0, 180.0), (10.0, -180.0)]
+
+    def distances_from(self, latitude, longitude):
+        return sorted(
+            (haversine_km(latitude, longitude, city_latitude, city_longitude), name)
+            for name, city_latitude, city_longitude in self.cities
+        )
+
+    def test_nearest_matches_brute_force(self):
+        for latitude, longitude in self.queries:
+            with self.subTest(latitude=latitude, longitude=longitude):
+                distance, name = self.distances_from(latitude, longitude)[0]
+                city = self.index.nearest(latitude, longitude)
+                self.assertAlmostEqual(city['distance_km'], distance, delta=0.01)
+                if city['name'] != name:
+                    # Only acceptable for a tie
+                    self.assertAlmostEqual(distance, haversine_km(latitude, longitude, city['latitude'], city['longitude']), delta=0.01)
+
+    def test_within_radius_matches_brute_force(self):
+        for latitude, longitude in self.queries:
+            for radius_km in (0, 500, 2500, 25000):
+                with self.subTest(latitude=latitude, longitude=longitude, radius_km=radius_km):
+                    expected = [
+                        (distance, name) for distance, name in self.distances_from(latitude, longitude)
+                        # Leave out cities too close to the edge to tell apart from rounding
+                        if abs(distance - radius_km) > 0.01
+                    ]
+                    found = {city['name']: city['distance_km'] for city in self.index.within_radius(latitude, longitude, radius_km)}
+                    for distance, name in expected:
+                        self.assertEqual(name in found, distance <= radius_km, name)
+                        if name in found:
+                            self.assertAlmostEqual(found[name], distance, delta=0.1)
+
+    def test_within_radius_is_sorted_by_distance(self):
+        cities = self.index.within_radius(10.0, 179.0, 3000)
+        self.assertEqual([city['name'] for city in cities[:2]], ['East', 'West'])
+        distances = [city['distance_km'] for city in cities]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_empty_index(self):
+        index = CityIndex([('No coordinates', None, None)])
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.nearest(0, 0))
+        self.assertEqual(index.within_radius(0, 0, 100), [])
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def bucket(self, **config):
+        # Refills too slowly to matter unless a test sets the rate
+        config = dict({'rate': 0.0001, 'capacity': 5, 'reserve': 0, 'policy': 'reject'}, **config)
+        return TokenBucket('test', state_dir=self.state_dir, **config)
+
+    def test_reserve_is_kept_for_priority_callers(self):
+        bucket = self.bucket(reserve=2)
+        for i in range(3):
+            bucket.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire()
+
+        with priority_requests():
+            bucket.acquire()
+            bucket.acquire()
+            with self.assertRaises(RateLimitExceeded):
+                bucket.acquire()
+
+    def test_reserve_leaves_at_least_one_normal_token(self):
+        bucket = self.bucket(capacity=3, reserve=10)
+        bucket.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire()
+
+    def test_reject_fails_at_once(self):
+        bucket = self.bucket(capacity=1, rate=1)
+        bucket.acquire()
+        started = time.monotonic()
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_queue_waits_for_a_token(self):
+        bucket = self.bucket(capacity=1, rate=20, policy='queue', max_wait=2)
+        bucket.acquire()
+        started = time.monotonic()
+        bucket.acquire()
+        self.assertGreater(time.monotonic() - started, 0.02)
+
+    def test_queue_gives_up_after_max_wait(self):
+        bucket = self.bucket(capacity=1, rate=0.1, policy='queue', max_wait=0.1)
+        bucket.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire()
+
+    def test_state_is_shared_between_buckets(self):
+        # Separate instances stand in for separate processes using the same file
+        self.bucket(capacity=2).acquire()
+        self.bucket(capacity=2).acquire()
+        with self.assertRaises(RateLimitExceeded):
+            self.bucket(capacity=2).acquire()
+
+    def test_throttle_drains_the_bucket(self):
+        bucket = self.bucket(rate=1, capacity=60)
+        bucket.throttle(30)
+        # 30 seconds of refills just bring it back to empty, the next token takes one more
+        with priority_requests():
+            with self.assertRaisesRegex(RateLimitExceeded, r"retry in 3[01]\.\d+s"):
+                bucket.acquire()
+
+
+class ReferenceSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'reference.snapshot')
+        self.cities = [('Vancouver', 49.2827, -123.1207), ('Québec', 46.8139, -71.2080), ('Victoria', 48.4284, -123.3656)]
+        self.durations = [[0, 100.5, None], [110.25, 0, 300], [None, 320, 0]]
+        self.distances = [[0, 1000, None], [1100, 0, None], [None, 3200, 0]]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        write_snapshot(self.path, self.cities, self.durations, self.distances)
+        snapshot = ReferenceSnapshot(self.path)
+
+        self.assertEqual(snapshot.count, 3)
+        self.assertEqual(snapshot.names, ['Vancouver', 'Québec', 'Victoria'])
+        self.assertEqual(snapshot.cities(), self.cities)
+        self.assertIn('Québec', snapshot)
+        self.assertEqual(snapshot.location_choices(), [('', 'Select a location')] + [(name, name) for name, lat, lon in self.cities])
+        self.assertEqual(snapshot.coordinates_of('Victoria'), [-123.3656, 48.4284])
+        self.assertIsNone(snapshot.coordinates_of('Nowhere'))
+
+        self.assertEqual(snapshot.pair('Vancouver', 'Québec'), (100.5, 1000))
+        self.assertEqual(snapshot.pair('Québec', 'Victoria'), (300, None))
+        self.assertIsNone(snapshot.pair('Vancouver', 'Victoria'))
+        self.assertIsNone(snapshot.pair('Vancouver', 'Nowhere'))
+
+        self.assertEqual(snapshot.duration_matrix(['Québec', 'Vancouver']), [[0, 110.25], [100.5, 0]])
+        self.assertIsNone(snapshot.duration_matrix(['Vancouver', 'Victoria']))
+
+    def test_without_route_tables(self):
+        write_snapshot(self.path, self.cities)
+        snapshot = ReferenceSnapshot(self.path)
+        self.assertEqual(snapshot.cities(), self.cities)
+        self.assertIsNone(snapshot.pair('Vancouver', 'Québec'))
+
+    def test_empty(self):
+        write_snapshot(self.path, [])
+        snapshot = ReferenceSnapshot(self.path)
+        self.assertEqual(snapshot.count, 0)
+        self.assertEqual(snapshot.cities(), [])
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as other:
+            other.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            ReferenceSnapshot(self.path)
+
+
+class ForecastStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ForecastStore(self.directory)
+        self.start = 1700000000
+        self.forecast = {
+            'city': {'timezone': -28800},
+            'list': [
+                {'dt': self.start + SLOT_SECONDS * i, 'main': {'temp': 10.5 + i}, 'weather': [{'id': 500 if i == 1 else 800}]}
+                for i in reversed(range(4))
+            ]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        series = ForecastSeries.from_api(self.forecast, fetched_at=self.start - 60)
+        self.store.write('Québec City', series)
+        loaded = ForecastStore(self.directory).read('Québec City')
+
+        self.assertEqual(loaded.timezone_offset, -28800)
+        self.assertEqual(loaded.fetched_at, self.start - 60)
+        self.assertEqual(list(loaded.timestamps), [self.start + SLOT_SECONDS * i for i in range(4)])
+        self.assertEqual(list(loaded.temps), [10.5, 11.5, 12.5, 13.5])
+        self.assertEqual(list(loaded.conditions), [800, 500, 800, 800])
+
+    def test_slot_at(self):
+        series = ForecastSeries.from_api(self.forecast)
+        self.assertIsNone(series.slot_at(self.start - 1))
+        self.assertEqual(series.slot_at(self.start), 0)
+        self.assertEqual(series.slot_at(self.start + SLOT_SECONDS + 1), 1)
+        self.assertEqual(series.slot_at(self.start + SLOT_SECONDS * 4 - 1), 3)
+        self.assertIsNone(series.slot_at(self.start + SLOT_SECONDS * 4))
+
+    def test_missing_city(self):
+        self.assertIsNone(self.store.read('Nowhere'))
+
+    def test_rewrite_replaces_cached_series(self):
+        self.store.write('Vancouver', ForecastSeries.from_api(self.forecast))
+        self.assertEqual(len(self.store.read('Vancouver')), 4)
+
+        self.forecast['list'] = self.forecast['list'][:2]
+        self.store.write('Vancouver', ForecastSeries.from_api(self.forecast))
+        # Make sure the modification time differs on coarse-grained filesystems
+        path = self.store.path_for('Vancouver')
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+        self.assertEqual(len(self.store.read('Vancouver')), 2)
+
+    def test_rejects_other_files(self):
+        with open(self.store.path_for('Vancouver'), 'wb') as other:
+            other.write(b'\0' * 64)
+        self.assertIsNone(self.store.read('Vancouver'))
+
+    def test_truncated_files(self):
+        self.store.write('Vancouver', ForecastSeries.from_api(self.forecast))
+        path = self.store.path_for('Vancouver')
+        with open(path, 'rb') as forecast_file:
+            data = forecast_file.read()
+
+        # Cut inside the header, after a whole item and inside an item of the last column
+        for size in (10, len(data) - 2, len(data) - 1):
+            with self.subTest(size=size):
+                with open(path, 'wb') as forecast_file:
+                    forecast_file.write(data[:size])
+                self.assertIsNone(ForecastStore(self.directory).read('Vancouver'))
+
+
+class DeparturePlannerTests(SimpleTestCase):
+
+    # 2024-05-01 06:00 UTC, the first forecast slot
+    first_slot = 1714543200
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ForecastStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, city, conditions, temps=None, timezone_offset=0):
+        timestamps = [self.first_slot + SLOT_SECONDS * i for i in range(len(conditions))]
+        temps = temps or [15.0] * len(conditions)
+        self.store.write(city, ForecastSeries(
+            timezone_offset, self.first_slot,
+            array.array('I', timestamps), array.array('f', temps), array.array('H', conditions)
+        ))
+
+    def plan(self, duration=0, limit=10, now=None):
+        return plan_departures('Vancouver', 'Victoria', duration, limit=limit, now=now or self.first_slot, store=self.store)
+
+    def hours(self, window):
+        return (window['depart_from'].hour, window['depart_until'].hour)
+
+    def test_consecutive_slots_are_merged(self):
+        # Slots from 06:00 to 03:00 the next day
+        self.write('Vancouver', [800] * 8)
+        self.write('Victoria', [800] * 8)
+
+        windows = self.plan()
+        self.assertEqual([self.hours(window) for window in windows], [(6, 0), (0, 6)])
+        self.assertEqual(windows[0]['issues'], [])
+        self.assertEqual(windows[1]['issues'], ['very late/early departure'])
+        self.assertEqual(windows[0]['depart_until'] - windows[0]['depart_from'], datetime.timedelta(hours=18))
+
+    def test_best_windows_first(self):
+        self.write('Vancouver', [800, 800, 500, 800, 800, 800, 800, 800])
+        self.write('Victoria', [800] * 8)
+
+        windows = self.plan(limit=3)
+        self.assertEqual([self.hours(window) for window in windows], [(6, 12), (15, 0), (12, 15)])
+        self.assertEqual(windows[2]['issues'], ['rain at Vancouver'])
+
+    def test_arrival_uses_the_destination_slot(self):
+        self.write('Vancouver', [800] * 8)
+        # Snow at Victoria from 12:00 to 15:00, then extreme cold at 21:00
+        self.write('Victoria', [800, 800, 601, 800, 800, 800, 800, 800], temps=[15.0] * 5 + [-20.0] + [15.0] * 2)
+
+        # Four hour trips: leaving at 09:00 arrives in the snow, leaving at
+        # 18:00 in the cold, and leaving at 03:00 is past the Victoria forecast
+        windows = self.plan(duration=4 * 3600)
+        by_hours = {self.hours(window): window['issues'] for window in windows}
+        self.assertEqual(by_hours, {
+            (6, 9): [],
+            (9, 12): ['snow at Victoria'],
+            (12, 18): [],
+            (18, 21): ['extreme cold at Victoria'],
+            (21, 0): [],
+            (0, 3): ['very late/early departure'],
+        })
+        window = windows[0]
+        self.assertEqual(window['arrive_from'] - window['depart_from'], datetime.timedelta(hours=4))
+
+    def test_departure_hours_are_local(self):
+        # 06:00 UTC is 23:00 the day before in Vancouver
+        self.write('Vancouver', [800] * 8, timezone_offset=-7 * 3600)
+        self.write('Victoria', [800] * 8, timezone_offset=-7 * 3600)
+
+        windows = self.plan(limit=1)
+        self.assertEqual(self.hours(windows[0]), (8, 23))
+        self.assertEqual(windows[0]['depart_from'].utcoffset(), datetime.timedelta(hours=-7))
+
+    def test_now_inside_a_slot(self):
+        self.write('Vancouver', [800] * 8)
+        self.write('Victoria', [800] * 8)
+
+        windows = self.plan(now=self.first_slot + 4 * 3600)
+        self.assertEqual(windows[0]['depart_from'].hour, 10)
+        self.assertEqual(windows[0]['depart_from'].minute, 0)
+
+        # Nothing left once the forecast is over
+        self.assertEqual(self.plan(now=self.first_slot + 8 * SLOT_SECONDS), [])
+
+    def test_missing_forecast(self):
+        self.write('Vancouver', [800] * 8)
+        self.assertIsNone(self.plan())
+
+
+@override_settings(SMARTRAVEL_PROFILING=True)
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        settings_override = override_settings(SMARTRAVEL_PROFILING_DIR=self.profile_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        RouteStats.objects.create(start='Vancouver', destination='Victoria', trip_count=1)
+
+    def profiles(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_valid_token_in_header(self):
+        response = self.client.get(reverse('route_stats_api'), HTTP_X_SMARTRAVEL_PROFILE=make_profiling_token())
+        self.assertEqual(response.status_code, 200)
+
+        # Queries are timed even though the view does not mark a db phase itself
+        self.assertRegex(response['Server-Timing'], r'(^|, )db;dur=\d+\.\d(, |$)')
+        self.assertRegex(response['Server-Timing'], r'(^|, )total;dur=\d+\.\d$')
+
+        [profile] = self.profiles()
+        self.assertTrue(profile.endswith('-get-api-stats-routes.prof'))
+        stats = pstats.Stats(os.path.join(self.profile_dir, profile))
+        self.assertIn('route_stats_api', {function for filename, line, function in stats.stats})
+
+    def test_valid_token_in_query(self):
+        response = self.client.get(reverse('route_stats_api'), {'profile': make_profiling_token()})
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_missing_token(self):
+        response = self.client.get(reverse('route_stats_api'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.profiles(), [])
+
+    def test_bad_tokens(self):
+        other_salt = signing.TimestampSigner(salt='other').sign('profile')
+        for token in ('bad', make_profiling_token() + 'x', other_salt):
+            with self.subTest(token=token):
+                response = self.client.get(reverse('route_stats_api'), HTTP_X_SMARTRAVEL_PROFILE=token)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(SMARTRAVEL_PROFILING_TOKEN_MAX_AGE=-1)
+    def test_expired_token(self):
+        response = self.client.get(reverse('route_stats_api'), HTTP_X_SMARTRAVEL_PROFILE=make_profiling_token())
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(SMARTRAVEL_PROFILING=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('route_stats_api'), HTTP_X_SMARTRAVEL_PROFILE=make_profiling_token())
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.profiles(), [])
+
+
+OFFERED_CITIES = [('', 'Select a location'), ('Vancouver', 'Vancouver'), ('Victoria', 'Victoria'), ('Kamloops', 'Kamloops')]
+
+
+def fake_weather(city, condition='Clouds'):
+    return WeatherSnapshot(name=city, temp=12.5, humidity=80, condition=condition, description='broken clouds')
+
+
+def fake_route(origin, destination, duration=5400):
+    return RouteSummary(
+        True, origin=origin, destination=destination, duration=duration, distance=duration * 20,
+        steps=[('Head south', duration * 10), ('Arrive', duration * 10)]
+    )
+
+
+@mock.patch('smartravelapp.views.get_location_choices', return_value=OFFERED_CITIES)
+class StreamedResultTests(TestCase):
+
+    def stream(self, directions=None, weather=fake_weather, best_departure=None):
+        directions = directions or mock.Mock(side_effect=fake_route)
+        with mock.patch('smartravelapp.views.get_weather', side_effect=weather), \
+                mock.patch('smartravelapp.views.get_directions_between_locations', directions), \
+                mock.patch('smartravelapp.views.suggest_departure', return_value=best_departure):
+            response = self.client.post(reverse('travel_stream'), {'start': 'Vancouver', 'destination': 'Victoria'})
+            self.assertTrue(response.streaming)
+            return [chunk.decode() for chunk in response.streaming_content]
+
+    def fragments(self, chunks):
+        return {
+            slot: chunk for chunk in chunks[1:-1]
+            for slot in ('start_weather', 'destination_weather', 'directions', 'recommendation', 'best_departure')
+            if f'id="fragment-{slot}"' in chunk
+        }
+
+    def test_streams_shell_fragments_and_tail(self, location_choices):
+        chunks = self.stream()
+
+        # The shell comes first, with every slot still loading
+        self.assertIn('id="slot-directions">Loading...', chunks[0])
+        self.assertNotIn('<template', chunks[0])
+
+        fragments = self.fragments(chunks)
+        self.assertEqual(set(fragments), {'start_weather', 'destination_weather', 'directions', 'recommendation'})
+        self.assertIn('Vancouver: 12.5°C, Broken Clouds, Humidity: 80%', fragments['start_weather'])
+        self.assertIn('Route: 90 minutes, 108.0 km', fragments['directions'])
+
+        self.assertIn('Back to Travel Form', chunks[-1])
+        self.assertIn('</html>', chunks[-1])
+
+        history = TravelHistory.objects.get()
+        self.assertEqual((history.start, history.destination, history.directions_ok), ('Vancouver', 'Victoria', True))
+        self.assertEqual(RouteStats.objects.get().routed_count, 1)
+
+    def test_failing_task_still_finishes_the_page(self, location_choices):
+        chunks = self.stream(directions=mock.Mock(side_effect=RuntimeError('connection reset')))
+
+        fragments = self.fragments(chunks)
+        self.assertIn('Directions Error: connection reset', fragments['directions'])
+        self.assertIn('start_weather', fragments)
+        self.assertIn('recommendation', fragments)
+        self.assertIn('Back to Travel Form', chunks[-1])
+
+        history = TravelHistory.objects.get()
+        self.assertFalse(history.directions_ok)
+        self.assertIn('connection reset', history.directions)
+
+    def test_failing_weather_task(self, location_choices):
+        def weather(city):
+            if city == 'Victoria':
+                raise RuntimeError('weather down')
+            return fake_weather(city)
+
+        fragments = self.fragments(self.stream(weather=weather))
+        self.assertIn('Weather Error: weather down', fragments['destination_weather'])
+        self.assertIn('Unable to get weather data', fragments['recommendation'])
+        self.assertEqual(TravelHistory.objects.count(), 1)
+
+    def test_best_departure_when_delaying(self, location_choices):
+        chunks = self.stream(weather=lambda city: fake_weather(city, condition='Rain'), best_departure='Mon 08:00 - 11:00')
+        fragments = self.fragments(chunks)
+        self.assertIn('Consider delaying', fragments['recommendation'])
+        self.assertIn('Mon 08:00 - 11:00', fragments['best_departure'])
+        self.assertIn('Back to Travel Form', chunks[-1])
+
+
+@mock.patch('smartravelapp.views.get_location_choices', return_value=OFFERED_CITIES)
+class BatchTripsTests(TestCase):
+
+    trips = [
+        ('Vancouver', 'Victoria'), ('Vancouver', 'Victoria'), ('Victoria', 'Vancouver'),
+        ('Vancouver', 'Kamloops'), ('Vancouver', 'Victoria'), ('Kamloops', 'Kamloops'),
+    ]
+    coordinates = {'Vancouver': [-123.12, 49.28], 'Victoria': [-123.37, 48.43], 'Kamloops': [-120.33, 50.67]}
+
+    def post(self, payload):
+        self.weather = mock.Mock(side_effect=fake_weather)
+        self.geocode = mock.Mock(side_effect=self.coordinates.get)
+        self.route = mock.Mock(side_effect=lambda coordinates, origin, destination: fake_route(origin, destination))
+        with mock.patch('smartravelapp.batch_trips.get_weather', self.weather), \
+                mock.patch.object(DirectionsAPI, 'geocode_address', self.geocode), \
+                mock.patch.object(DirectionsAPI, 'get_route', self.route):
+            return self.client.post(reverse('batch_trips_api'), json.dumps(payload), content_type='application/json')
+
+    def test_upstream_calls_grow_with_distinct_cities_and_routes(self, location_choices):
+        response = self.post({'trips': [{'start': start, 'destination': destination} for start, destination in self.trips]})
+        self.assertEqual(response.status_code, 200)
+
+        # 6 trips, 3 distinct cities, 4 distinct routes
+        self.assertEqual(self.weather.call_count, 3)
+        self.assertEqual(self.geocode.call_count, 3)
+        self.assertEqual(self.route.call_count, 4)
+        self.assertEqual(
+            sorted(call.args[1:] for call in self.route.call_args_list),
+            sorted(set(self.trips))
+        )
+
+        data = response.json()
+        self.assertEqual((data['distinct_cities'], data['distinct_routes']), (3, 4))
+        self.assertEqual([(trip['start'], trip['destination']) for trip in data['trips']], self.trips)
+        for trip in data['trips']:
+            self.assertEqual(set(trip), {'start', 'destination', 'start_weather', 'destination_weather', 'directions', 'recommendation'})
+            self.assertTrue(trip['start_weather'].startswith(f"{trip['start']}: 12.5°C"))
+            self.assertTrue(trip['directions'].startswith('Route: 90 minutes'))
+
+        # Nothing is saved unless asked for
+        self.assertEqual(TravelHistory.objects.count(), 0)
+        self.assertEqual(RouteStats.objects.count(), 0)
+
+    def test_save_writes_history_and_route_stats(self, location_choices):
+        response = self.post({'trips': [{'start': start, 'destination': destination} for start, destination in self.trips], 'save': True})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            sorted(TravelHistory.objects.values_list('start', 'destination')),
+            sorted(self.trips)
+        )
+        self.assertTrue(all(TravelHistory.objects.values_list('directions_ok', flat=True)))
+
+        stats = RouteStats.objects.get(start='Vancouver', destination='Victoria')
+        self.assertEqual((stats.trip_count, stats.routed_count, stats.mean_duration), (3, 3, 5400))
+        self.assertEqual(RouteStats.objects.count(), 4)
+
+    def test_invalid_trips(self, location_choices):
+        for payload in (
+            {'trips': []},
+            {'trips': [{'start': 'Vancouver'}]},
+            {'trips': [{'start': ['Vancouver'], 'destination': 'Victoria'}]},
+            {'trips': [{'start': 'Atlantis', 'destination': 'Victoria'}]},
+        ):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post(payload).status_code, 400)
+        self.assertEqual(self.route.call_count, 0)
+
+
+@mock.patch('smartravelapp.views.get_location_choices', return_value=OFFERED_CITIES)
+class MultiStopStatsTests(TestCase):
+
+    def multi_stop_route(self):
+        route = fake_route('Vancouver', 'Victoria', duration=20000)
+        route.stops = ('Vancouver', 'Kamloops', 'Victoria')
+        return route
+
+    def test_multi_stop_trip_is_not_a_direct_route(self, location_choices):
+        RouteStats.record_trips('Vancouver', 'Victoria', fake_route('Vancouver', 'Victoria'))
+        with mock.patch('smartravelapp.views.plan_trip', return_value=self.multi_stop_route()), \
+                mock.patch('smartravelapp.views.get_weather', side_effect=fake_weather):
+            response = self.client.post(reverse('trip_form'), {
+                'start': 'Vancouver', 'stops': ['Kamloops'], 'destination': 'Victoria'
+            })
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(TravelHistory.objects.get().destination, 'Victoria')
+        stats = RouteStats.objects.get()
+        self.assertEqual((stats.trip_count, stats.mean_duration), (1, 5400))
+
+    def test_record_trips_skips_multi_stop_directions(self, location_choices):
+        self.assertIsNone(RouteStats.record_trips('Vancouver', 'Victoria', self.multi_stop_route()))
+        self.assertIsNone(RouteStats.record_trips('Vancouver', 'Victoria', self.multi_stop_route().as_dict()))
+        self.assertFalse(RouteStats.objects.exists())
+
+        route = fake_route('Vancouver', 'Victoria')
+        route.stops = ('Vancouver', 'Victoria')
+        self.assertEqual(RouteStats.record_trips('Vancouver', 'Victoria', route).trip_count, 1)
+
+
+class HistoryFilterTests(TestCase):
+
+    def add_history(self, start, destination, day, success=True):
+        directions = fake_route(start, destination) if success else RouteSummary.failure('No route found')
+        history = TravelHistory.objects.create(
+            start=start, destination=destination,
+            start_weather=str(fake_weather(start).as_dict()),
+            destination_weather=str(fake_weather(destination).as_dict()),
+            directions=str(directions.as_dict()), directions_ok=success
+        )
+        history.time = timezone.make_aware(datetime.datetime(2024, 5, day, 12))
+        history.save(update_fields=['time'])
+        return history
+
+    def setUp(self):
+        self.vancouver_victoria = self.add_history('Vancouver', 'Victoria', 1)
+        self.victoria_vancouver = self.add_history('Victoria', 'Vancouver', 2, success=False)
+        self.kelowna_victoria = self.add_history('Kelowna', 'Victoria', 3)
+
+    def filtered(self, **filters):
+        return set(filter_histories(TravelHistory.objects.all(), filters))
+
+    def test_filters(self):
+        everything = {self.vancouver_victoria, self.victoria_vancouver, self.kelowna_victoria}
+        self.assertEqual(self.filtered(), everything)
+        self.assertEqual(self.filtered(start='', destination='', status=''), everything)
+        self.assertEqual(self.filtered(start='Vancouver'), {self.vancouver_victoria})
+        self.assertEqual(self.filtered(destination='Victoria'), {self.vancouver_victoria, self.kelowna_victoria})
+        self.assertEqual(self.filtered(start='Kelowna', destination='Victoria'), {self.kelowna_victoria})
+        self.assertEqual(self.filtered(status='success'), {self.vancouver_victoria, self.kelowna_victoria})
+        self.assertEqual(self.filtered(status='failed'), {self.victoria_vancouver})
+
+    def test_date_range_includes_both_days(self):
+        self.assertEqual(
+            self.filtered(date_from=datetime.date(2024, 5, 2), date_to=datetime.date(2024, 5, 3)),
+            {self.victoria_vancouver, self.kelowna_victoria}
+        )
+        self.assertEqual(self.filtered(date_to=datetime.date(2024, 5, 1)), {self.vancouver_victoria})
+        self.assertEqual(self.filtered(date_from=datetime.date(2024, 5, 4)), set())
+
+    @mock.patch('smartravelapp.get_locations.get_locations_from_api')
+    def test_search_api_takes_cities_that_are_not_offered(self, get_locations_from_api):
+        response = self.client.get(reverse('history_search_api'), {'start': 'Kelowna'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [self.kelowna_victoria.id])
+
+        response = self.client.get(reverse('history_search_api'), {'status': 'sometimes'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_locations_from_api.call_count, 0)
+
+    def test_backfill_directions_ok(self):
+        migration = importlib.import_module('smartravelapp.migrations.0003_travelhistory_filters')
+        TravelHistory.objects.update(directions_ok=False)
+
+        migration.backfill_directions_ok(apps, None)
+        self.assertEqual(
+            set(TravelHistory.objects.filter(directions_ok=True)),
+            {self.vancouver_victoria, self.kelowna_victoria}
+        )
+
+
+# A full OpenWeatherMap response, stored as str(dict) like the first releases did
+BASELINE_WEATHER = {
+    'coord': {'lon': -123.1193, 'lat': 49.2497},
+    'weather': [{'id': 803, 'main': 'Clouds', 'description': 'broken clouds', 'icon': '04d'}],
+    'base': 'stations',
+    'main': {'temp': 12.5, 'feels_like': 11.9, 'temp_min': 11.1, 'temp_max': 13.8, 'pressure': 1016, 'humidity': 80},
+    'visibility': 10000,
+    'wind': {'speed': 3.6, 'deg': 250},
+    'clouds': {'all': 75},
+    'dt': 1714564800,
+    'sys': {'type': 2, 'id': 2011597, 'country': 'CA', 'sunrise': 1714567353, 'sunset': 1714620425},
+    'timezone': -25200,
+    'id': 6173331,
+    'name': 'Vancouver',
+    'cod': 200,
+}
+
+
+class RecordsTests(SimpleTestCase):
+
+    def baseline_directions(self):
+        return {
+            'success': True,
+            'origin': 'Vancouver',
+            'destination': 'Victoria',
+            'duration': 5400.0,
+            'distance': 108000.0,
+            'steps': [
+                {'instruction': "Head south on O'Brien Rd", 'distance': 400.0},
+                {'instruction': 'Turn right onto False Creek Rd', 'distance': 107600.0},
+            ],
+            'raw_data': DIRECTIONS_FIXTURE,
+        }
+
+    def test_format_baseline_weather(self):
+        self.assertEqual(format_weather_for_history(str(BASELINE_WEATHER)), 'Vancouver: 12.5°C, Broken Clouds')
+        self.assertEqual(format_weather_for_history(str({'error': 'City not found'})), 'Weather Error')
+        self.assertEqual(format_weather_for_history("{'name': 'Vancouver', 'main': {"), 'Weather data corrupted')
+        self.assertEqual(format_weather_for_history(None), 'Weather unavailable')
+
+    def test_format_baseline_directions(self):
+        self.assertEqual(format_directions_for_history(str(self.baseline_directions())), '90 min, 108.0 km')
+        self.assertEqual(
+            format_directions_for_history(str({'success': False, 'error': 'No routes found in the response.'})),
+            'No routes found in the response.'
+        )
+        self.assertEqual(format_directions_for_history("{'success': True, 'duration'"), 'Directions data corrupted')
+        self.assertEqual(format_directions_for_history(None), 'Directions unavailable')
+
+    def test_stored_text_is_kept(self):
+        directions = RouteSummary.from_dict(parse_stored_data(str(self.baseline_directions())))
+        self.assertEqual(
+            [instruction for instruction, distance in directions.steps],
+            ["Head south on O'Brien Rd", 'Turn right onto False Creek Rd']
+        )
+        self.assertEqual(directions.raw_data, DIRECTIONS_FIXTURE)
+
+    def test_json_rows_still_parse(self):
+        self.assertEqual(
+            parse_stored_data(json.dumps({'success': True, 'duration': 60, 'stops': None})),
+            {'success': True, 'duration': 60, 'stops': None}
+        )
+
+    def test_weather_round_trip(self):
+        for weather in (
+            WeatherSnapshot.from_api(BASELINE_WEATHER),
+            WeatherSnapshot(name='Victoria', temp=-2.0, condition='Snow'),
+            WeatherSnapshot(error='City not found'),
+        ):
+            with self.subTest(weather=weather):
+                stored = WeatherSnapshot.from_api(parse_stored_data(str(weather.as_dict())))
+                self.assertEqual(stored.as_dict(), weather.as_dict())
+                self.assertEqual(
+                    [getattr(stored, name) for name in WeatherSnapshot.__slots__],
+                    [getattr(weather, name) for name in WeatherSnapshot.__slots__]
+                )
+
+    def test_route_round_trip(self):
+        for directions in (
+            RouteSummary.from_dict(self.baseline_directions()),
+            RouteSummary(
+                True, origin='Vancouver', destination='Victoria', duration=9000, distance=180000,
+                steps=[('Head east', 1000)], legs=[(3600, 80000), (5400, 100000)],
+                stops=('Vancouver', 'Kamloops', 'Victoria')
+            ),
+            RouteSummary.failure('Routing error: Request timed out'),
+        ):
+            with self.subTest(directions=directions):
+                stored = RouteSummary.from_dict(parse_stored_data(str(directions.as_dict())))
+                self.assertEqual(stored.as_dict(), directions.as_dict())
+                self.assertEqual(
+                    [getattr(stored, name) for name in RouteSummary.__slots__],
+                    [getattr(directions, name) for name in RouteSummary.__slots__]
+                )
+
+
+class ArchiveHistoryTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def add_history(self, start, destination, time):
+        history = TravelHistory.objects.create(
+            start=start, destination=destination,
+            start_weather=str(fake_weather(start).as_dict()),
+            destination_weather=str(fake_weather(destination).as_dict()),
+            directions=str(fake_route(start, destination).as_dict()), directions_ok=True
+        )
+        history.time = time
+        history.save(update_fields=['time'])
+        return history
+
+    def archive(self, **options):
+        out = io.StringIO()
+        call_command('archive_history', archive_dir=self.directory, stdout=out, **options)
+        return out.getvalue()
+
+    def test_archives_old_rows_by_day(self):
+        day = timezone.localdate() - datetime.timedelta(days=120)
+        noon = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        old = [
+            self.add_history('Vancouver', 'Victoria', noon),
+            self.add_history('Victoria', 'Kamloops', noon + datetime.timedelta(hours=1)),
+            self.add_history('Kamloops', 'Vancouver', noon + datetime.timedelta(days=1)),
+        ]
+        recent = self.add_history('Vancouver', 'Kamloops', timezone.now())
+
+        output = self.archive(older_than_days=90, batch_size=2)
+        self.assertIn('Archived 3 rows', output)
+        self.assertEqual(list(TravelHistory.objects.all()), [recent])
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            [f'date={day.isoformat()}', f'date={(day + datetime.timedelta(days=1)).isoformat()}']
+        )
+
+        records = list(iter_archived_history(archive_dir=self.directory))
+        self.assertEqual(sorted(record['id'] for record in records), sorted(history.id for history in old))
+        self.assertEqual(records[0]['time'], old[0].time)
+        self.assertEqual(records[0]['directions'], old[0].directions)
+
+        second_day = list(iter_archived_history(day + datetime.timedelta(days=1), day + datetime.timedelta(days=1), self.directory))
+        self.assertEqual([record['id'] for record in second_day], [old[2].id])
+        first_day = list(iter_archived_history(end_date=day, archive_dir=self.directory))
+        self.assertEqual(sorted(record['id'] for record in first_day), [old[0].id, old[1].id])
+        self.assertEqual(list(iter_archived_history(start_date=day + datetime.timedelta(days=2), archive_dir=self.directory)), [])
+
+    def test_dry_run_keeps_rows(self):
+        self.add_history('Vancouver', 'Victoria', timezone.now() - datetime.timedelta(days=120))
+        self.assertIn('1 rows', self.archive(older_than_days=90, dry_run=True))
+        self.assertEqual(TravelHistory.objects.count(), 1)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rejects_empty_batches(self):
+        self.add_history('Vancouver', 'Victoria', timezone.now() - datetime.timedelta(days=120))
+        for batch_size in (0, -5):
+            with self.subTest(batch_size=batch_size):
+                with self.assertRaises(CommandError):
+                    self.archive(batch_size=batch_size)
+        self.assertEqual(TravelHistory.objects.count(), 1)
+
+
+DIRECTIONS_FIXTURE = {
+    'bbox': [-123.37, 48.43, -123.12, 49.28],
+    'routes': [{
+        'summary': {'distance': 3000.0, 'duration': 300.0},
+        'segments': [
+            {'distance': 1000.0, 'duration': 100.0, 'steps': [
+                {'distance': 400.0, 'duration': 40.0, 'type': 11, 'instruction': 'Head south on Main St', 'name': 'Main St', 'way_points': [0, 3]},
+                {'distance': 600.0, 'duration': 60.0, 'type': 10, 'instruction': 'Arrive at your stop', 'name': '-', 'way_points': [3, 3]},
+            ]},
+            {'distance': 2000.0, 'duration': 200.0, 'steps': [
+                {'distance': 2000.0, 'duration': 200.0, 'type': 10, 'instruction': 'Arrive at Victoria', 'name': '-', 'way_points': [3, 9]},
+            ]},
+        ],
+        'geometry': 'gfo}EtohhUxD@bAxJmGF' * 200,
+        'way_points': [0, 3, 9],
+    }],
+    'metadata': {'service': 'routing', 'query': {'coordinates': [[-123.12, 49.28], [-123.37, 48.43]]}},
+}
+DIRECTIONS_BODY = json.dumps(DIRECTIONS_FIXTURE).encode()
+
+
+class DroppingBody(io.BytesIO):
+    """
+    Response body whose connection is reset after `limit` bytes.
+    """
+
+    def __init__(self, data, limit=None):
+        super().__init__(data)
+        self.limit = limit
+
+    def read(self, size=-1):
+        if self.limit is not None:
+            if self.tell() >= self.limit:
+                raise ConnectionResetError('Connection reset by peer')
+            remaining = self.limit - self.tell()
+            size = remaining if size is None or size < 0 else min(size, remaining)
+        return super().read(size)
+
+
+def directions_response(body=DIRECTIONS_BODY, drop_after=None, status=200):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = urllib3.HTTPResponse(
+        body=DroppingBody(body, drop_after), preload_content=False, status=status,
+        headers={'Content-Type': 'application/json'}
+    )
+    return response
+
+
+@mock.patch('smartravelapp.get_directions.acquire')
+class RouteResponseTests(SimpleTestCase):
+
+    coordinates = [[-123.12, 49.28], [-123.2, 48.9], [-123.37, 48.43]]
+
+    def get_route(self, use_ijson=True, keep_raw=False, **response):
+        with mock.patch('smartravelapp.get_directions.requests.post', return_value=directions_response(**response)), \
+                mock.patch.object(get_directions, 'ijson', get_directions.ijson if use_ijson else None):
+            return DirectionsAPI(keep_raw=keep_raw).get_route(self.coordinates, 'Vancouver', 'Victoria')
+
+    def parse_paths(self):
+        paths = [('json', {'use_ijson': False}), ('keep_raw', {'keep_raw': True})]
+        if get_directions.ijson is not None:
+            paths.append(('ijson', {}))
+        return paths
+
+    def test_parse_paths_give_the_same_summary(self, acquire):
+        expected = {
+            'success': True, 'origin': 'Vancouver', 'destination': 'Victoria', 'duration': 300.0, 'distance': 3000.0,
+            'steps': [
+                {'instruction': 'Head south on Main St', 'distance': 400.0},
+                {'instruction': 'Arrive at your stop', 'distance': 600.0},
+                {'instruction': 'Arrive at Victoria', 'distance': 2000.0},
+            ],
+            'legs': [{'duration': 100.0, 'distance': 1000.0}, {'duration': 200.0, 'distance': 2000.0}],
+        }
+        for name, options in self.parse_paths():
+            with self.subTest(path=name):
+                route = self.get_route(**options)
+                summary = route.as_dict()
+                raw_data = summary.pop('raw_data', None)
+                self.assertEqual(summary, expected)
+                self.assertEqual(raw_data, DIRECTIONS_FIXTURE if options.get('keep_raw') else None)
+
+    def test_alternative_routes_are_ignored(self, acquire):
+        alternative = {'segments': [{'distance': 9.0, 'duration': 9.0, 'steps': [{'distance': 9.0, 'instruction': 'Detour'}]}]}
+        body = json.dumps(dict(DIRECTIONS_FIXTURE, routes=DIRECTIONS_FIXTURE['routes'] + [alternative])).encode()
+        for name, options in self.parse_paths():
+            with self.subTest(path=name):
+                route = self.get_route(body=body, **options)
+                self.assertEqual((route.duration, route.distance, len(route.steps)), (300.0, 3000.0, 3))
+
+    def test_dropped_connection_is_an_error_summary(self, acquire):
+        for name, options in self.parse_paths():
+            for drop_after in (0, 200, len(DIRECTIONS_BODY) - 10):
+                with self.subTest(path=name, drop_after=drop_after):
+                    route = self.get_route(drop_after=drop_after, **options)
+                    self.assertFalse(route.success)
+                    self.assertIn('Routing failed', route.error)
+                    self.assertIn('Connection reset', route.error)
+
+    def test_truncated_or_invalid_body_is_an_error_summary(self, acquire):
+        for name, options in self.parse_paths():
+            for body in (DIRECTIONS_BODY[:200], DIRECTIONS_BODY[:-1], b'<html>Bad gateway</html>', b''):
+                with self.subTest(path=name, body=body[:20]):
+                    route = self.get_route(body=body, **options)
+                    self.assertFalse(route.success)
+                    self.assertIn('Invalid directions response', route.error)
+
+    def test_error_status(self, acquire):
+        body = json.dumps({'error': {'code': 2010, 'message': 'Could not find routable point within a radius'}}).encode()
+        route = self.get_route(body=body, status=404)
+        self.assertFalse(route.success)
+        self.assertIn('Cannot find drivable roads', route.error)
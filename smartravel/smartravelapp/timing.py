@@ -0,0 +1,58 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Phase timings for the request currently being handled. None means nobody is
+# collecting, so phase() costs a single ContextVar lookup.
+_phase_timings = ContextVar('smartravel_phase_timings', default=None)
+
+
+def start_collecting(timings=None):
+    """
+    Start collecting phase timings for the current request.
+
+    Pass the timings dict of an earlier call to keep adding to it, e.g.
+    while the body of a streamed response is generated.
+
+    Returns:
+        tuple: (timings dict, token to pass to stop_collecting())
+    """
+    if timings is None:
+        timings = {}
+    token = _phase_timings.set(timings)
+    return timings, token
+
+
+def stop_collecting(token):
+    """
+    Stop collecting phase timings started with start_collecting().
+    """
+    _phase_timings.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a block of code and add it to the named phase of the current request.
+
+    Repeated phases (e.g. weather for both cities) are summed.
+    """
+    timings = _phase_timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - started)
+
+
+def format_server_timing(timings):
+    """
+    Format phase timings (in seconds) as a Server-Timing header value.
+    """
+    return ', '.join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
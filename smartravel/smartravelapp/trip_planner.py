@@ -0,0 +1,204 @@
+import requests
+import logging
+
+try:
+    from .get_directions import DirectionsAPI
+    from .records import RouteSummary
+    from .snapshot import get_snapshot
+except ImportError:  # Running as a standalone script
+    from get_directions import DirectionsAPI
+    from records import RouteSummary
+    from snapshot import get_snapshot
+
+# Cost used for pairs the matrix API could not route, so the solver avoids them
+UNROUTABLE_COST = 10 ** 9
+
+
+def path_cost(order, matrix):
+    """
+    Total cost of visiting the matrix indices in the given order.
+    """
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+
+def nearest_neighbour_order(matrix, start=0, end=None):
+    """
+    Build a visiting order by always going to the closest unvisited stop.
+
+    Args:
+        matrix (list): Square cost matrix
+        start (int): Index of the fixed first stop
+        end (int): Index of the fixed last stop, or None for an open path
+
+    Returns:
+        list: Matrix indices in visiting order
+    """
+    remaining = set(range(len(matrix))) - {start}
+    if end is not None:
+        remaining.discard(end)
+
+    order = [start]
+    current = start
+    while remaining:
+        current = min(remaining, key=lambda stop: matrix[current][stop])
+        order.append(current)
+        remaining.remove(current)
+
+    if end is not None and end != start:
+        order.append(end)
+    return order
+
+
+def two_opt(order, matrix, fixed_end=False):
+    """
+    Improve a visiting order by reversing sub-paths while that makes it cheaper.
+
+    The first stop (and the last one when fixed_end is set) never moves. Each
+    candidate reversal is scored in O(1) using prefix sums of the forward and
+    backward leg costs, so asymmetric matrices are handled exactly.
+
+    Args:
+        order (list): Matrix indices in visiting order
+        matrix (list): Square cost matrix
+        fixed_end (bool): Whether the last stop must stay last
+
+    Returns:
+        list: Improved visiting order
+    """
+    order = list(order)
+    last_movable = len(order) - (2 if fixed_end else 1)
+
+    improved = True
+    while improved:
+        improved = False
+
+        # forward[k] / backward[k]: cost of order[0..k] walked forwards / backwards
+        forward = [0]
+        backward = [0]
+        for a, b in zip(order, order[1:]):
+            forward.append(forward[-1] + matrix[a][b])
+            backward.append(backward[-1] + matrix[b][a])
+
+        for i in range(1, last_movable):
+            before = order[i - 1]
+            for j in range(i + 1, last_movable + 1):
+                # Cost change of reversing order[i..j]
+                delta = (
+                    matrix[before][order[j]] - matrix[before][order[i]]
+                    + (backward[j] - backward[i]) - (forward[j] - forward[i])
+                )
+                if j + 1 < len(order):
+                    after = order[j + 1]
+                    delta += matrix[order[i]][after] - matrix[order[j]][after]
+
+                if delta < -1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+                    break
+            if improved:
+                break
+
+    return order
+
+
+def solve_stop_order(matrix, start=0, end=None):
+    """
+    Find a near-optimal visiting order with nearest-neighbour + 2-opt.
+
+    Args:
+        matrix (list): Square cost matrix, None for unroutable pairs
+        start (int): Index of the fixed first stop
+        end (int): Index of the fixed last stop, or None for an open path
+
+    Returns:
+        list: Matrix indices in visiting order
+    """
+    costs = [
+        [UNROUTABLE_COST if cost is None else cost for cost in row]
+        for row in matrix
+    ]
+    order = nearest_neighbour_order(costs, start, end)
+    return two_opt(order, costs, fixed_end=end is not None)
+
+
+class TripPlanner:
+    """
+    Plans multi-stop driving trips with a near-optimal stop order.
+    """
+
+    def __init__(self, directions_api=None):
+        self.directions_api = directions_api or DirectionsAPI()
+
+    def plan_trip(self, start, stops, destination=None):
+        """
+        Plan a trip from start through every stop, optionally ending at destination.
+
+        One duration matrix request and one multi-coordinate route request are
+        made; geocodes come from the DirectionsAPI cache and durations from the
+        reference snapshot where possible.
+
+        Args:
+            start (str): Starting location
+            stops (list): Locations to visit, in any order
+            destination (str): Final location, or None to end at the last stop
+
+        Returns:
+            RouteSummary: The whole trip (see DirectionsAPI.get_route) with the
+                          visiting order in stops, or error information.
+        """
+        # Drop duplicates and stops that are already the start or destination
+        stops = [
+            stop for i, stop in enumerate(stops)
+            if stop not in stops[:i] and stop != start and stop != destination
+        ]
+        locations = [start] + stops
+        if destination:
+            locations.append(destination)
+
+        if len(locations) < 2:
+            return RouteSummary.failure("Please choose at least one stop or a destination.")
+
+        coordinates = []
+        for location in locations:
+            try:
+                coords = self.directions_api.geocode_address(location)
+            except requests.RequestException as e:
+                logging.error(f"Error geocoding addresses: {e}")
+                return RouteSummary.failure(f"Geocoding failed: {e}")
+            if not coords:
+                return RouteSummary.failure(f"Unable to geocode address: '{location}'. Please check the spelling or try a more specific location name.")
+            coordinates.append(coords)
+
+        if len(stops) > 1:
+            # Use the precomputed route table when it covers every pair
+            snapshot = get_snapshot()
+            durations = snapshot.duration_matrix(locations) if snapshot is not None else None
+            if durations is None:
+                matrix = self.directions_api.get_duration_matrix(coordinates)
+                if not matrix['success']:
+                    return RouteSummary.failure(matrix['error'])
+                durations = matrix['durations']
+            end = len(locations) - 1 if destination else None
+            order = solve_stop_order(durations, 0, end)
+        else:
+            # Nothing to reorder
+            order = list(range(len(locations)))
+
+        ordered_locations = [locations[i] for i in order]
+        logging.info(f"Planned stop order: {' -> '.join(ordered_locations)}")
+
+        route = self.directions_api.get_route(
+            [coordinates[i] for i in order],
+            ordered_locations[0],
+            ordered_locations[-1]
+        )
+        if route.success:
+            route.stops = tuple(ordered_locations)
+        return route
+
+
+def plan_trip(start, stops, destination=None, api_key=None):
+    """
+    Function wrapper for easier importing in views
+    """
+    return TripPlanner(DirectionsAPI(api_key)).plan_trip(start, stops, destination)
@@ -1,8 +1,17 @@
 from django.urls import path
 
-from .views import travel_form_view, travel_history_list
+from .views import (travel_form_view, travel_history_list, multi_stop_trip_view, travel_stream_view,
+                    batch_trips_api, nearest_city_api, route_stats_api,
+                    departure_windows_api, history_search_api)
 
 urlpatterns = [
     path('', travel_form_view, name='travel_form'),
+    path('stream/', travel_stream_view, name='travel_stream'),
     path('history/', travel_history_list, name='travel_history'),
+    path('api/history/', history_search_api, name='history_search_api'),
+    path('trip/', multi_stop_trip_view, name='trip_form'),
+    path('api/trips/batch/', batch_trips_api, name='batch_trips_api'),
+    path('api/cities/nearest/', nearest_city_api, name='nearest_city_api'),
+    path('api/stats/routes/', route_stats_api, name='route_stats_api'),
+    path('api/departures/', departure_windows_api, name='departure_windows_api'),
 ]
@@ -1,89 +1,105 @@
 from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.http import StreamingHttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_GET
+from django.template.loader import render_to_string
+from django.conf import settings
 from django.contrib import messages
 import requests
 import logging
 import json
+import math
 import datetime
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .forms import TravelHistoryForm
-from .models import TravelHistory
-from .get_locations import get_locations_from_api
+from .forms import TravelHistoryForm, MultiStopTripForm, HistoryFilterForm
+from .models import TravelHistory, RouteStats
+from .records import WeatherSnapshot, RouteSummary, parse_stored_data
+from .get_locations import get_location_choices
 from .get_weather import get_weather
 from .get_directions import get_directions_between_locations
+from .trip_planner import plan_trip
+from .batch_trips import fetch_trip_data
+from .spatial_index import get_city_index
+from .snapshot import get_snapshot
+from .departure_planner import plan_departures, describe_window
+from .timing import phase
 
 # Create your views here.
 
-def parse_stored_data(data_string):
+def as_weather_snapshot(weather_data):
     """
-    Parse stored JSON string data safely
+    Get a WeatherSnapshot from fresh or stored weather data, or None if there is none
     """
-    if isinstance(data_string, dict):
-        return data_string
-    
-    if data_string is None or data_string == '':
-        return {}
-    
-    if isinstance(data_string, str):
-        try:
-            # Try to parse as JSON first
-            if data_string.startswith('{') or data_string.startswith('['):
-                # Clean up the string for JSON parsing
-                clean_string = data_string.replace("'", '"').replace('True', 'true').replace('False', 'false')
-                return json.loads(clean_string)
-            else:
-                # If it's not JSON, try to evaluate it safely (for dict strings)
-                import ast
-                return ast.literal_eval(data_string)
-        except (json.JSONDecodeError, ValueError, SyntaxError) as e:
-            # If parsing fails, return error dict
-            return {'error': f'Data parsing failed: {str(e)}'}
-    
-    return data_string
+    if isinstance(weather_data, str):
+        weather_data = parse_stored_data(weather_data)
+    if isinstance(weather_data, dict):
+        return WeatherSnapshot.from_api(weather_data)
+    if isinstance(weather_data, WeatherSnapshot):
+        return weather_data
+    return None
+
+def as_route_summary(directions_data):
+    """
+    Get a RouteSummary from fresh or stored directions data, or None if there is none
+    """
+    if isinstance(directions_data, str):
+        directions_data = parse_stored_data(directions_data)
+    if isinstance(directions_data, dict):
+        return RouteSummary.from_dict(directions_data)
+    if isinstance(directions_data, RouteSummary):
+        return directions_data
+    return None
+
+def is_corrupted(record):
+    """
+    Check whether a record comes from stored data that could not be parsed
+    """
+    return record.error is not None and 'Data parsing failed' in str(record.error)
 
 def format_weather_for_history(weather_data):
     """
     Format weather data for history display
     """
-    if isinstance(weather_data, str):
-        weather_data = parse_stored_data(weather_data)
+    weather = as_weather_snapshot(weather_data)
+    if weather is None:
+        return "Weather unavailable"
     
     # Check if parsing failed
-    if isinstance(weather_data, dict) and 'error' in weather_data and 'Data parsing failed' in weather_data.get('error', ''):
+    if is_corrupted(weather):
         return "Weather data corrupted"
     
-    if isinstance(weather_data, dict):
-        if 'error' in weather_data:
-            return "Weather Error"
-        
-        name = weather_data.get('name', 'Unknown')
-        temp = weather_data.get('main', {}).get('temp', 'N/A')
-        description = weather_data.get('weather', [{}])[0].get('description', 'N/A')
-        
-        return f"{name}: {temp}°C, {description.title()}"
+    if not weather.ok:
+        return "Weather Error"
     
-    return "Weather unavailable"
+    name = weather.name if weather.name is not None else 'Unknown'
+    temp = weather.temp if weather.temp is not None else 'N/A'
+    description = weather.description or 'N/A'
+    
+    return f"{name}: {temp}°C, {description.title()}"
 
 def format_directions_for_history(directions_data):
     """
     Format directions data for history display
     """
-    if isinstance(directions_data, str):
-        directions_data = parse_stored_data(directions_data)
+    directions = as_route_summary(directions_data)
+    if directions is None:
+        return "Directions unavailable"
     
     # Check if parsing failed
-    if isinstance(directions_data, dict) and 'error' in directions_data and 'Data parsing failed' in directions_data['error']:
+    if is_corrupted(directions):
         return "Directions data corrupted"
     
-    if isinstance(directions_data, dict):
-        if not directions_data.get('success', False):
-            return directions_data.get('error', 'Unknown error')
-        
-        duration_minutes = int(directions_data.get('duration', 0)) // 60
-        distance_km = directions_data.get('distance', 0) / 1000
-        
-        return f"{duration_minutes} min, {distance_km:.1f} km"
+    if not directions.success:
+        return directions.error
     
-    return "Directions unavailable"
+    duration_minutes = int(directions.duration) // 60
+    distance_km = directions.distance / 1000
+    
+    return f"{duration_minutes} min, {distance_km:.1f} km"
 
 
 def format_weather_data(weather_data):
@@ -91,18 +107,21 @@ def format_weather_data(weather_data):
     Format weather data for display in templates
     """
     if isinstance(weather_data, dict):
-        if 'error' in weather_data:
-            return f"Weather Error: {weather_data['error']}"
+        weather_data = WeatherSnapshot.from_api(weather_data)
+    
+    if isinstance(weather_data, WeatherSnapshot):
+        if not weather_data.ok:
+            return f"Weather Error: {weather_data.error}"
         
         # Extract useful weather information
         try:
-            name = weather_data.get('name', 'Unknown Location')
-            temp = weather_data.get('main', {}).get('temp', 'N/A')
-            description = weather_data.get('weather', [{}])[0].get('description', 'N/A')
-            humidity = weather_data.get('main', {}).get('humidity', 'N/A')
+            name = weather_data.name if weather_data.name is not None else 'Unknown Location'
+            temp = weather_data.temp if weather_data.temp is not None else 'N/A'
+            description = weather_data.description or 'N/A'
+            humidity = weather_data.humidity if weather_data.humidity is not None else 'N/A'
             
             return f"{name}: {temp}°C, {description.title()}, Humidity: {humidity}%"
-        except (KeyError, IndexError, TypeError):
+        except (AttributeError, TypeError):
             return "Weather data unavailable"
     
     return str(weather_data)
@@ -112,29 +131,30 @@ def format_directions_data(directions_data):
     Format directions data for display in templates
     """
     if isinstance(directions_data, dict):
-        if not directions_data.get('success', False):
-            return f"Directions Error: {directions_data.get('error', 'Unknown error')}"
+        directions_data = RouteSummary.from_dict(directions_data)
+    
+    if isinstance(directions_data, RouteSummary):
+        if not directions_data.success:
+            return f"Directions Error: {directions_data.error or 'Unknown error'}"
         
         try:
-            duration_minutes = directions_data['duration'] // 60
-            distance_km = directions_data['distance'] / 1000
+            duration_minutes = directions_data.duration // 60
+            distance_km = directions_data.distance / 1000
             
             result = f"Route: {duration_minutes} minutes, {distance_km:.1f} km\n\n"
             
             # Add all direction steps
-            steps = directions_data.get('steps', [])
-            if steps:
+            if directions_data.steps:
                 result += "Turn-by-turn Directions:\n"
                 result += "-" * 40 + "\n"
-                for i, step in enumerate(steps, 1):
-                    instruction = step.get('instruction', 'N/A')
-                    step_distance_km = step.get('distance', 0) / 1000
+                for i, (instruction, step_distance) in enumerate(directions_data.steps, 1):
+                    step_distance_km = step_distance / 1000
                     result += f"{i}. {instruction} ({step_distance_km:.1f} km)\n"
             else:
                 result += "No detailed directions available."
             
             return result
-        except (KeyError, TypeError, ZeroDivisionError):
+        except (TypeError, ZeroDivisionError):
             return "Directions data unavailable"
     
     return str(directions_data)
@@ -147,29 +167,18 @@ def get_travel_recommendation(start_weather, destination_weather):
     current_hour = current_time.hour
     
     # Parse weather data if needed
-    if isinstance(start_weather, str):
-        start_weather = parse_stored_data(start_weather)
-    if isinstance(destination_weather, str):
-        destination_weather = parse_stored_data(destination_weather)
+    start_weather = as_weather_snapshot(start_weather) or WeatherSnapshot()
+    destination_weather = as_weather_snapshot(destination_weather) or WeatherSnapshot()
     
     # Check for weather errors first
-    if (isinstance(start_weather, dict) and 'error' in start_weather) or \
-       (isinstance(destination_weather, dict) and 'error' in destination_weather):
+    if not start_weather.ok or not destination_weather.ok:
         return "Unable to get weather data for travel recommendation."
     
     # Extract weather conditions
-    start_condition = ""
-    dest_condition = ""
-    start_temp = 0
-    dest_temp = 0
-    
-    if isinstance(start_weather, dict) and 'weather' in start_weather:
-        start_condition = start_weather['weather'][0]['main'].lower()
-        start_temp = start_weather.get('main', {}).get('temp', 0)
-    
-    if isinstance(destination_weather, dict) and 'weather' in destination_weather:
-        dest_condition = destination_weather['weather'][0]['main'].lower()
-        dest_temp = destination_weather.get('main', {}).get('temp', 0)
+    start_condition = (start_weather.condition or "").lower()
+    dest_condition = (destination_weather.condition or "").lower()
+    start_temp = start_weather.temp or 0
+    dest_temp = destination_weather.temp or 0
     
     # Bad weather conditions
     bad_weather_conditions = ['rain', 'snow', 'thunderstorm', 'drizzle']
@@ -200,12 +209,48 @@ def get_travel_recommendation(start_weather, destination_weather):
     else:
         return f"Good time to start your trip! {time_message}"
 
+def save_travel_history(travel_history, directions, record_stats=True):
+    """
+    Save a history entry and add it to the statistics of its route.
+    
+    Multi-stop trips pass record_stats=False: their duration includes the
+    stops, so it would skew the stats of the direct route.
+    """
+    travel_history.directions_ok = directions.success
+    travel_history.save()
+    if record_stats:
+        RouteStats.record_trips(
+            travel_history.start, travel_history.destination, directions,
+            seen_at=travel_history.time
+        )
+
+def known_route_duration(start, destination):
+    """
+    Typical trip duration in seconds from local data only, or None if unknown
+    """
+    stats = RouteStats.objects.filter(start=start, destination=destination).first()
+    if stats is not None and stats.mean_duration is not None:
+        return stats.mean_duration
+    
+    snapshot = get_snapshot()
+    pair = snapshot.pair(start, destination) if snapshot is not None else None
+    return pair[0] if pair else None
+
+def suggest_departure(start, destination, duration):
+    """
+    Describe the next departure window without travel issues, if the forecasts have one
+    """
+    windows = plan_departures(start, destination, duration, limit=1)
+    if windows and not windows[0]['issues']:
+        return describe_window(windows[0])
+    return None
+
 def travel_form_view(request):
     """
     View to handle the travel form with API-fetched locations
     """
     # Get locations from API
-    location_choices = get_locations_from_api()
+    location_choices = get_location_choices()
     
     if request.method == 'POST':
         form = TravelHistoryForm(request.POST, location_choices=location_choices)
@@ -233,46 +278,443 @@ def travel_form_view(request):
                 'recommendation': travel_recommendation
             }
             
+            # Answer "until when?" from the local forecast store
+            if travel_recommendation.startswith('Consider delaying'):
+                duration = directions.duration if directions.success else None
+                best_departure = suggest_departure(start_city, destination_city, duration)
+                if best_departure:
+                    messages['best_departure'] = best_departure
+            
             # Save to database
             travel_history = form.save(commit=False)
-            travel_history.start_weather = str(start_weather)
-            travel_history.destination_weather = str(destination_weather)
-            travel_history.directions = str(directions)
-            travel_history.save()
+            travel_history.start_weather = str(start_weather.as_dict())
+            travel_history.destination_weather = str(destination_weather.as_dict())
+            travel_history.directions = str(directions.as_dict())
+            save_travel_history(travel_history, directions)
             
             # Redirect after successful submission
-            return render(request, 'smartravelapp/result.html', {
-                'messages': messages
-            })
+            with phase('render'):
+                return render(request, 'smartravelapp/result.html', {
+                    'messages': messages
+                })
     else:
         form = TravelHistoryForm(location_choices=location_choices)
     
-    return render(request, 'smartravelapp/travel_form.html', {
-        'form': form,
-        'title': 'Smart Travel Form'
-    })
+    with phase('render'):
+        return render(request, 'smartravelapp/travel_form.html', {
+            'form': form,
+            'title': 'Smart Travel Form'
+        })
+
+STREAM_MARKER = '<!-- smartravel:stream -->'
+
+def stream_travel_results(request, form):
+    """
+    Generate the result page in pieces: the page shell first, then each
+    weather report, the route and the recommendation as soon as it is ready
+    """
+    start_city = form.cleaned_data['start']
+    destination_city = form.cleaned_data['destination']
+    
+    shell = render_to_string('smartravelapp/result_stream.html', {
+        'start': start_city,
+        'destination': destination_city,
+        'stream_marker': STREAM_MARKER
+    }, request=request)
+    head, tail = shell.split(STREAM_MARKER, 1)
+    yield head
+    
+    def fragment(slot, value):
+        return render_to_string('smartravelapp/result_stream_fragment.html', {
+            'slot': slot,
+            'value': value
+        })
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        # Each task gets its own copy of the context so phase timings still apply
+        tasks = {
+            executor.submit(contextvars.copy_context().run, get_weather, start_city): 'start_weather',
+            executor.submit(contextvars.copy_context().run, get_weather, destination_city): 'destination_weather',
+            executor.submit(contextvars.copy_context().run, get_directions_between_locations, start_city, destination_city): 'directions',
+        }
+        for task in as_completed(tasks):
+            slot = tasks[task]
+            try:
+                results[slot] = task.result()
+            except Exception as e:
+                # Show the failure in its slot and keep streaming the rest of the page
+                logging.exception(f"Error fetching {slot} for the streamed result page")
+                results[slot] = RouteSummary.failure(str(e)) if slot == 'directions' else WeatherSnapshot(error=str(e))
+            
+            if slot == 'directions':
+                yield fragment(slot, format_directions_data(results[slot]))
+            else:
+                yield fragment(slot, format_weather_data(results[slot]))
+            
+            # The recommendation only needs the weather at both ends
+            if slot != 'directions' and 'start_weather' in results and 'destination_weather' in results:
+                results['recommendation'] = get_travel_recommendation(
+                    results['start_weather'], results['destination_weather']
+                )
+                yield fragment('recommendation', results['recommendation'])
+    
+    # Answer "until when?" from the local forecast store, like travel_form_view
+    if results['recommendation'].startswith('Consider delaying'):
+        directions = results['directions']
+        best_departure = suggest_departure(start_city, destination_city, directions.duration if directions.success else None)
+        if best_departure:
+            yield fragment('best_departure', best_departure)
+    
+    # Save to database
+    travel_history = form.save(commit=False)
+    travel_history.start_weather = str(results['start_weather'].as_dict())
+    travel_history.destination_weather = str(results['destination_weather'].as_dict())
+    travel_history.directions = str(results['directions'].as_dict())
+    try:
+        save_travel_history(travel_history, results['directions'])
+    except Exception:
+        # The results are already on the page, so still finish it
+        logging.exception("Error saving the streamed travel history")
+    
+    yield tail
+
+def travel_stream_view(request):
+    """
+    View to handle the travel form with a progressively streamed result page
+    """
+    if request.method != 'POST':
+        return redirect('travel_form')
+    
+    location_choices = get_location_choices()
+    form = TravelHistoryForm(request.POST, location_choices=location_choices)
+    if not form.is_valid():
+        with phase('render'):
+            return render(request, 'smartravelapp/travel_form.html', {
+                'form': form,
+                'title': 'Smart Travel Form'
+            })
+    
+    response = StreamingHttpResponse(stream_travel_results(request, form))
+    # Ask proxies such as nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def filter_histories(histories, filters):
+    """
+    Apply cleaned HistoryFilterForm data to a TravelHistory queryset.
+    
+    Every filter maps to an indexed column, so no directions blobs are parsed.
+    """
+    if filters.get('start'):
+        histories = histories.filter(start=filters['start'])
+    if filters.get('destination'):
+        histories = histories.filter(destination=filters['destination'])
+    if filters.get('date_from'):
+        histories = histories.filter(time__gte=timezone.make_aware(
+            datetime.datetime.combine(filters['date_from'], datetime.time.min)
+        ))
+    if filters.get('date_to'):
+        histories = histories.filter(time__lt=timezone.make_aware(
+            datetime.datetime.combine(filters['date_to'] + datetime.timedelta(days=1), datetime.time.min)
+        ))
+    if filters.get('status') == 'success':
+        histories = histories.filter(directions_ok=True)
+    elif filters.get('status') == 'failed':
+        histories = histories.filter(directions_ok=False)
+    return histories
+
+def format_history(history):
+    """
+    Format a history entry for display
+    """
+    return {
+        'id': history.id,
+        'start': history.start,
+        'destination': history.destination,
+        'time': history.time,
+        'start_weather': format_weather_for_history(history.start_weather),
+        'destination_weather': format_weather_for_history(history.destination_weather),
+        'directions': format_directions_for_history(history.directions)
+    }
 
 def travel_history_list(request):
     """
     View to display list of travel histories with formatted data
     """
+    filter_form = HistoryFilterForm(request.GET or None)
     histories = TravelHistory.objects.all().order_by('-time')
+    if filter_form.is_bound and filter_form.is_valid():
+        histories = filter_histories(histories, filter_form.cleaned_data)
+    
+    histories = list(histories)
     
     # Format the data for better display
-    formatted_histories = []
-    for history in histories:
-        formatted_history = {
-            'id': history.id,
-            'start': history.start,
-            'destination': history.destination,
-            'time': history.time,
-            'start_weather': format_weather_for_history(history.start_weather),
-            'destination_weather': format_weather_for_history(history.destination_weather),
-            'directions': format_directions_for_history(history.directions)
-        }
-        formatted_histories.append(formatted_history)
+    formatted_histories = [format_history(history) for history in histories]
+    
+    with phase('render'):
+        return render(request, 'smartravelapp/travel_history.html', {
+            'histories': formatted_histories,
+            'filter_form': filter_form,
+            'title': 'Travel History'
+        })
+
+@require_GET
+def history_search_api(request):
+    """
+    JSON API to search travel history, newest first.
+    
+    Takes the same filters as the history page (start, destination,
+    date_from, date_to as YYYY-MM-DD, status=success|failed) plus
+    limit (default 50) and offset.
+    """
+    filter_form = HistoryFilterForm(request.GET)
+    if not filter_form.is_valid():
+        return JsonResponse({'error': 'Invalid filters.', 'fields': filter_form.errors}, status=400)
     
-    return render(request, 'smartravelapp/travel_history.html', {
-        'histories': formatted_histories,
-        'title': 'Travel History'
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 50)), 500))
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'The "limit" and "offset" parameters must be numbers.'}, status=400)
+    
+    histories = filter_histories(TravelHistory.objects.order_by('-time'), filter_form.cleaned_data)
+    page = list(histories[offset:offset + limit])
+    
+    results = []
+    for history in page:
+        result = format_history(history)
+        result['time'] = history.time.isoformat()
+        result['directions_ok'] = history.directions_ok
+        results.append(result)
+    
+    return JsonResponse({'results': results, 'offset': offset, 'limit': limit})
+
+def multi_stop_trip_view(request):
+    """
+    View to plan a trip through several cities in a near-optimal order
+    """
+    # Get locations from API
+    location_choices = get_location_choices()
+    max_stops = getattr(settings, 'SMARTRAVEL_MAX_TRIP_STOPS', 25)
+    
+    if request.method == 'POST':
+        form = MultiStopTripForm(request.POST, location_choices=location_choices, max_stops=max_stops)
+        if form.is_valid():
+            start_city = form.cleaned_data['start']
+            destination_city = form.cleaned_data['destination'] or None
+            
+            # Order the stops and get one route through all of them
+            directions = plan_trip(start_city, form.cleaned_data['stops'], destination_city)
+            final_city = directions.stops[-1] if directions.success else (destination_city or start_city)
+            
+            # Get weather data for both ends of the trip
+            start_weather = get_weather(start_city)
+            destination_weather = get_weather(final_city)
+            
+            travel_recommendation = get_travel_recommendation(start_weather, destination_weather)
+            
+            messages = {
+                'start': start_city,
+                'destination': final_city,
+                'stops': ' -> '.join(directions.stops or ()) or 'Not available',
+                'start_weather': format_weather_data(start_weather),
+                'destination_weather': format_weather_data(destination_weather),
+                'directions': format_directions_data(directions),
+                'recommendation': travel_recommendation
+            }
+            
+            # Save the whole trip as a single history entry
+            travel_history = TravelHistory(
+                start=start_city,
+                destination=final_city,
+                start_weather=str(start_weather.as_dict()),
+                destination_weather=str(destination_weather.as_dict()),
+                directions=str(directions.as_dict())
+            )
+            save_travel_history(travel_history, directions, record_stats=False)
+            
+            with phase('render'):
+                return render(request, 'smartravelapp/result.html', {
+                    'messages': messages
+                })
+    else:
+        form = MultiStopTripForm(location_choices=location_choices, max_stops=max_stops)
+    
+    with phase('render'):
+        return render(request, 'smartravelapp/trip_form.html', {
+            'form': form,
+            'title': 'Multi-Stop Trip'
+        })
+
+@csrf_exempt
+@require_POST
+def batch_trips_api(request):
+    """
+    JSON API to plan many trips at once.
+    
+    Expects {"trips": [{"start": ..., "destination": ...}, ...], "save": false}
+    and returns one result per trip, in order, shaped like the result page.
+    """
+    try:
+        payload = json.loads(request.body)
+        trips = [(trip['start'], trip['destination']) for trip in payload['trips']]
+        if not all(isinstance(start, str) and isinstance(destination, str) for start, destination in trips):
+            raise TypeError("Trip locations must be strings")
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({
+            'error': 'Expected a JSON object with a "trips" list of {"start", "destination"} objects.'
+        }, status=400)
+    
+    max_trips = getattr(settings, 'SMARTRAVEL_BATCH_MAX_TRIPS', 500)
+    if not trips or len(trips) > max_trips:
+        return JsonResponse({'error': f'Please send between 1 and {max_trips} trips.'}, status=400)
+    
+    # Only the offered locations can be planned, like in the form
+    offered = {value for value, label in get_location_choices() if value}
+    invalid = [
+        index for index, (start, destination) in enumerate(trips)
+        if start not in offered or destination not in offered
+    ]
+    if invalid:
+        return JsonResponse({
+            'error': 'Unknown start or destination location.',
+            'invalid_trips': invalid
+        }, status=400)
+    
+    weather, directions = fetch_trip_data(
+        trips, max_workers=getattr(settings, 'SMARTRAVEL_BATCH_MAX_WORKERS', 8)
+    )
+    
+    # Format each distinct city and route once and share it between trips
+    formatted_weather = {city: format_weather_data(data) for city, data in weather.items()}
+    formatted_directions = {pair: format_directions_data(data) for pair, data in directions.items()}
+    
+    results = []
+    for start, destination in trips:
+        results.append({
+            'start': start,
+            'destination': destination,
+            'start_weather': formatted_weather[start],
+            'destination_weather': formatted_weather[destination],
+            'directions': formatted_directions[(start, destination)],
+            'recommendation': get_travel_recommendation(weather[start], weather[destination])
+        })
+    
+    if payload.get('save'):
+        histories = [
+            TravelHistory(
+                start=start,
+                destination=destination,
+                start_weather=str(weather[start].as_dict()),
+                destination_weather=str(weather[destination].as_dict()),
+                directions=str(directions[(start, destination)].as_dict()),
+                directions_ok=directions[(start, destination)].success
+            )
+            for start, destination in trips
+        ]
+        TravelHistory.objects.bulk_create(histories, batch_size=100)
+        for (start, destination), count in Counter(trips).items():
+            RouteStats.record_trips(
+                start, destination, directions[(start, destination)], count,
+                seen_at=histories[-1].time
+            )
+    
+    return JsonResponse({
+        'trips': results,
+        'distinct_cities': len(weather),
+        'distinct_routes': len(directions)
+    })
+
+@require_GET
+def nearest_city_api(request):
+    """
+    JSON API mapping a coordinate to the nearest offered city.
+    
+    Takes ?lat=&lon= and returns {"city": {...}}. With &radius_km= it returns
+    every offered city within that distance instead, closest first.
+    """
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+        radius_km = float(request.GET['radius_km']) if 'radius_km' in request.GET else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Please provide numeric "lat" and "lon" parameters.'}, status=400)
+    
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (radius_km is not None and not (math.isfinite(radius_km) and radius_km >= 0)):
+        return JsonResponse({'error': 'Coordinates or radius out of range.'}, status=400)
+    
+    index = get_city_index()
+    if radius_km is not None:
+        return JsonResponse({'cities': index.within_radius(latitude, longitude, radius_km)})
+    
+    city = index.nearest(latitude, longitude)
+    if city is None:
+        return JsonResponse({'error': 'No offered cities are available.'}, status=503)
+    return JsonResponse({'city': city})
+
+@require_GET
+def route_stats_api(request):
+    """
+    JSON API with pre-aggregated trip statistics per route, most travelled first.
+    
+    Optional ?start=, ?destination= filters and ?limit= (default 50).
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 50)), 1000))
+    except ValueError:
+        return JsonResponse({'error': 'The "limit" parameter must be a number.'}, status=400)
+    
+    stats = RouteStats.objects.order_by('-trip_count')
+    if request.GET.get('start'):
+        stats = stats.filter(start=request.GET['start'])
+    if request.GET.get('destination'):
+        stats = stats.filter(destination=request.GET['destination'])
+    
+    routes = [route.as_dict() for route in stats[:limit]]
+    return JsonResponse({'routes': routes})
+
+@require_GET
+def departure_windows_api(request):
+    """
+    JSON API with the best departure windows for a trip, from the local
+    forecast store and known route durations only.
+    
+    Takes ?start=&destination= and optional &duration= (seconds) and &limit=.
+    """
+    start = request.GET.get('start')
+    destination = request.GET.get('destination')
+    if not start or not destination:
+        return JsonResponse({'error': 'Please provide "start" and "destination" parameters.'}, status=400)
+    
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 3)), 20))
+        duration = float(request.GET['duration']) if 'duration' in request.GET else known_route_duration(start, destination)
+    except ValueError:
+        return JsonResponse({'error': 'The "duration" and "limit" parameters must be numbers.'}, status=400)
+    
+    if duration is None:
+        return JsonResponse({'error': 'No known route duration for this trip, please provide "duration".'}, status=404)
+    if not math.isfinite(duration) or duration < 0:
+        return JsonResponse({'error': 'The "duration" parameter must be a non-negative number of seconds.'}, status=400)
+    
+    windows = plan_departures(start, destination, duration, limit=limit)
+    if windows is None:
+        return JsonResponse({'error': 'No forecast available for the start or destination.'}, status=404)
+    
+    return JsonResponse({
+        'start': start,
+        'destination': destination,
+        'duration': duration,
+        'windows': [
+            {
+                'depart_from': window['depart_from'].isoformat(),
+                'depart_until': window['depart_until'].isoformat(),
+                'arrive_from': window['arrive_from'].isoformat(),
+                'arrive_until': window['arrive_until'].isoformat(),
+                'issues': window['issues']
+            }
+            for window in windows
+        ]
     })